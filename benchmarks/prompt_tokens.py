@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Prompt token benchmark for the compact schema and compact review quiz.
+
+Compares, for the sample quizzes and documents in the repository, the prompt size of
+- the generation prompt with the full Response.json vs the compact schema, and
+- the review prompt with the raw quiz vs the compact quiz rendering,
+and checks that the compact versions keep everything the models need (all schema
+keys; every stem, option and answer).
+
+With --live (requests go to the model, or are served from a cassette, see MCQ_CASSETTE)
+- quizzes are generated from data.txt with both schemas and compared for validity,
+  question count and whether the JSON fixing stage had to change them, and
+- the review prompt is sent both ways and the reviews are compared for completeness.
+
+Usage:
+  python benchmarks/prompt_tokens.py
+  python benchmarks/prompt_tokens.py --live --trials 5
+"""
+
+import os
+import sys
+import ast
+import glob
+import json
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REVIEW_SECTIONS = [
+    "COMPLEXITY ANALYSIS", "QUALITY ASSESSMENT", "DIFFICULTY EVALUATION",
+    "TONE ANALYSIS", "CONTENT VALIDATION", "OVERALL RECOMMENDATIONS",
+]
+
+
+def count_tokens(text):
+    """tiktoken's cl100k_base when installed (close to Llama 3's tokenizer), else the ~4 chars/token estimate."""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        from src.mcq_generator.retrieval import estimate_tokens
+        return estimate_tokens(text)
+
+
+def load_sample_quizzes():
+    """Rebuild quizzes from the *_info.csv / *_questions.csv pairs written by save_mcqs_to_csv."""
+    import pandas as pd
+
+    quizzes = {}
+    for questions_file in sorted(glob.glob(os.path.join(ROOT, "**", "*_questions.csv"), recursive=True)):
+        info_file = questions_file[:-len("_questions.csv")] + "_info.csv"
+        questions = pd.read_csv(questions_file).to_dict("records")
+        for q in questions:
+            q["options"] = ast.literal_eval(q["options"])
+        info = pd.read_csv(info_file).to_dict("records")[0] if os.path.exists(info_file) else {}
+        quizzes[os.path.relpath(questions_file, ROOT)] = {"quiz_info": info, "questions": questions}
+
+    with open(os.path.join(ROOT, "Response.json"), "r") as f:
+        quizzes["Response.json"] = json.load(f)
+    return quizzes
+
+
+def schema_keys(node, prefix=""):
+    keys = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            keys.add(prefix + key)
+            keys |= schema_keys(value, prefix + key + ".")
+    elif isinstance(node, list) and node:
+        keys |= schema_keys(node[0], prefix)
+    return keys
+
+
+def compact_quiz_is_lossless(quiz, compact):
+    """Every stem, option text and answer key of the quiz appears in the compact rendering."""
+    from src.mcq_generator.compact import _terse
+
+    for q in quiz["questions"]:
+        if _terse(q["question"]) not in compact:
+            return False
+        for key, value in q["options"].items():
+            if f"{key}) {_terse(value)}" not in compact:
+                return False
+        if f"ans {q['correct_answer']}" not in compact:
+            return False
+    return True
+
+
+def generation_quality(generation, schema, trials):
+    """
+    Generate quizzes with a schema and check them locally.
+
+    Returns:
+    - dict: 'valid' (parsable, well-formed, requested question count), 'questions'
+      per trial and 'fixed' (trials whose quiz the JSON fixing stage changed).
+    """
+    from src.mcq_generator.MCQgenerator import llm, llm_json_fixer, quiz_generation_prompt, fix_json_prompt
+    from src.mcq_generator.hedging import is_valid_quiz_output, parse_quiz_output
+
+    result = {"valid": 0, "questions": [], "fixed": 0}
+    for _ in range(trials):
+        quiz = llm.invoke(quiz_generation_prompt.format(schema=schema, **generation)).content
+        fixed = llm_json_fixer.invoke(fix_json_prompt.format(quiz=quiz)).content
+        parsed = parse_quiz_output(quiz)
+        result["valid"] += is_valid_quiz_output(quiz, generation["number"])
+        result["questions"].append(len(parsed.get("questions") or []) if isinstance(parsed, dict) else 0)
+        result["fixed"] += parsed is None or parsed != parse_quiz_output(fixed)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure prompt token savings of the compact prompts")
+    parser.add_argument("--live", action="store_true",
+                        help="Also run generation and review both ways and compare the outputs")
+    parser.add_argument("--trials", type=int, default=3, help="Quizzes generated per schema with --live (default: 3)")
+    args = parser.parse_args()
+
+    if not args.live:
+        # No request is made offline; the models are only constructed on import
+        os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+    from src.mcq_generator.MCQgenerator import TEMPLATE, quiz_evaluation_prompt, REVIEW_EXPLANATION_CHARS, llm
+    from src.mcq_generator.compact import compact_schema, compact_quiz
+
+    with open(os.path.join(ROOT, "Response.json"), "r") as f:
+        response_json = json.load(f)
+    with open(os.path.join(ROOT, "data.txt"), "r", encoding="utf-8") as f:
+        document = f.read()
+
+    full_schema = json.dumps(response_json)
+    small_schema = compact_schema(response_json)
+    generation = {"text": document, "number": 5, "subject": "computer vision", "tone": "Simple"}
+    full_prompt = TEMPLATE.format(schema=full_schema, **generation)
+    small_prompt = TEMPLATE.format(schema=small_schema, **generation)
+    keys_kept = schema_keys(response_json) == schema_keys(json.loads(small_schema))
+
+    print("Generation prompt (data.txt, 5 questions)")
+    print(f"  full schema:    {count_tokens(full_prompt):>6} tokens")
+    print(f"  compact schema: {count_tokens(small_prompt):>6} tokens "
+          f"({count_tokens(full_prompt) - count_tokens(small_prompt)} saved, all schema keys kept: {keys_kept})")
+    ok = keys_kept
+
+    if args.live:
+        full = generation_quality(generation, full_schema, args.trials)
+        small = generation_quality(generation, small_schema, args.trials)
+        for label, result in (("full schema:", full), ("compact schema:", small)):
+            print(f"  {label:<16}valid {result['valid']}/{args.trials}, questions {result['questions']}, "
+                  f"changed by JSON fixing {result['fixed']}/{args.trials}")
+        ok = ok and small["valid"] >= full["valid"] and small["fixed"] <= full["fixed"]
+    print()
+
+    print("Review prompt")
+    print(f"  {'quiz':<58} {'raw':>6} {'compact':>8} {'saved':>6}  lossless")
+    totals = [0, 0]
+    for name, quiz in load_sample_quizzes().items():
+        raw = json.dumps(quiz, ensure_ascii=False, indent=2)
+        small = compact_quiz(raw, REVIEW_EXPLANATION_CHARS)
+        raw_tokens = count_tokens(quiz_evaluation_prompt.format(subject="computer vision", compact_quiz=raw))
+        small_tokens = count_tokens(quiz_evaluation_prompt.format(subject="computer vision", compact_quiz=small))
+        lossless = compact_quiz_is_lossless(quiz, small)
+        ok = ok and lossless
+        totals[0] += raw_tokens
+        totals[1] += small_tokens
+        print(f"  {name:<58} {raw_tokens:>6} {small_tokens:>8} {raw_tokens - small_tokens:>6}  {lossless}")
+
+        if args.live:
+            raw_review = llm.invoke(quiz_evaluation_prompt.format(subject="computer vision", compact_quiz=raw)).content
+            small_review = llm.invoke(quiz_evaluation_prompt.format(subject="computer vision", compact_quiz=small)).content
+            raw_sections = sum(s in raw_review.upper() for s in REVIEW_SECTIONS)
+            small_sections = sum(s in small_review.upper() for s in REVIEW_SECTIONS)
+            ok = ok and small_sections >= raw_sections
+            print(f"    review sections present: raw {raw_sections}/6, compact {small_sections}/6; "
+                  f"output tokens raw {count_tokens(raw_review)}, compact {count_tokens(small_review)}")
+
+    saved = 100.0 * (totals[0] - totals[1]) / totals[0] if totals[0] else 0.0
+    print(f"  {'total':<58} {totals[0]:>6} {totals[1]:>8} {totals[0] - totals[1]:>6}  ({saved:.0f}% saved)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,8 @@ setup(
         "PyPDF2",
         "requests",  # For API calls
         "pandas",  # For data handling
+        "numpy",  # For passage ranking
+        "pyarrow",  # Parquet analytics store
     ],
     python_requires=">=3.8",
     classifiers=[
@@ -1,9 +1,15 @@
 import os
 import json
+import asyncio
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain, SequentialChain
+from langchain.chains import LLMChain, SequentialChain, TransformChain
+from src.mcq_generator.cassette import wrap_llm
+from src.mcq_generator.hedging import DEFAULT_HEDGE_POLICY, hedged_call, is_valid_quiz_output
+from src.mcq_generator.deadline import Deadline, DeadlineExceeded
+from src.mcq_generator.profiling import span
+from src.mcq_generator.compact import compact_quiz, compact_schema
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -27,6 +33,10 @@ llm_json_fixer = ChatGroq(
     stop_sequences=[]
 )
 
+# Record/replay support: pass-through unless a cassette is active (see cassette.py)
+llm = wrap_llm(llm, "generator")
+llm_json_fixer = wrap_llm(llm_json_fixer, "json_fixer")
+
 TEMPLATE = """
 # MCQ Generation Instructions
 
@@ -46,7 +56,9 @@ You are an expert MCQ maker. Given the above text, it is your job to create a qu
 Please format your response using the following JSON structure as a guide:
 
 ### RESPONSE_JSON
-{response_json}
+{schema}
+
+Values give the type or the allowed values; `correct_answer` is one of the `options` keys.
 
 ## Instructions
 - Create clear, well-structured multiple choice questions
@@ -56,17 +68,26 @@ Please format your response using the following JSON structure as a guide:
 """
 
 quiz_generation_prompt = PromptTemplate(
-    input_variables=["text", "number", "subject", "tone", "response_json"],
+    input_variables=["text", "number", "subject", "tone", "schema"],
     template=TEMPLATE
     )
 
+# The prompt's note on values assumes the compact schema; compacting an already compact one is a no-op
+schema_chain = TransformChain(
+    input_variables=["response_json"],
+    output_variables=["schema"],
+    transform=lambda inputs: {"schema": compact_schema(inputs["response_json"])}
+)
+
 quiz_chain=LLMChain(llm=llm, prompt=quiz_generation_prompt, output_key="quiz", verbose=True)
 
 TEMPLATE2 = """
 # Quiz Review and Analysis Instructions
 
 ## Input Quiz
-{quiz}
+Each question is its stem followed by one line with its options and answer key.
+
+{compact_quiz}
 
 ## Task Description
 You are an expert English grammarian and writer. Given a Multiple Choice Quiz for {subject} students, you need to evaluate the complexity of the questions and provide a complete analysis of the quiz.
@@ -113,10 +134,19 @@ Provide your analysis in the following structure:
 - Identify areas that need improvement while maintaining objectivity
 """
 
-quiz_evaluation_prompt=PromptTemplate(input_variables=["subject", "quiz"], template=TEMPLATE2)
+quiz_evaluation_prompt=PromptTemplate(input_variables=["subject", "compact_quiz"], template=TEMPLATE2)
 
 review_chain=LLMChain(llm=llm, prompt=quiz_evaluation_prompt, output_key="review", verbose=True)
 
+# The reviewer only needs stems, options and answers; explanations are cut to this many characters (0 drops them)
+REVIEW_EXPLANATION_CHARS = 0
+
+compact_chain = TransformChain(
+    input_variables=["quiz"],
+    output_variables=["compact_quiz"],
+    transform=lambda inputs: {"compact_quiz": compact_quiz(inputs["quiz"], REVIEW_EXPLANATION_CHARS)}
+)
+
 TEMPLATE_fix_json = """
 You will receive a string that is meant to be JSON but may contain syntax errors like:
 - Missing commas, quotes, or brackets
@@ -145,16 +175,97 @@ fix_json_chain = LLMChain(
 )
 
 generate_evaluate_chain=SequentialChain(
-    chains=[quiz_chain, review_chain, fix_json_chain],
+    chains=[schema_chain, quiz_chain, compact_chain, review_chain, fix_json_chain],
     input_variables=["text", "number", "subject", "tone", "response_json"],
     output_variables=["quiz", "review", "fixed_quiz"],
     verbose=False
 )
 
 
+async def _run_stage(stage, awaitable, deadline):
+    """Run one LLM stage within the deadline, timed as a profiling span."""
+    with span(stage):
+        return await deadline.run(awaitable, stage)
+
+
+async def agenerate_evaluate(inputs, deadline=None, hedge=False, policy=None):
+    """
+    Async version of generate_evaluate_chain with deadlines and optional hedging.
+
+    Every LLM stage runs within the request's deadline and is cancelled when it
+    passes. The review is optional: if it cannot finish in time the result carries
+    an empty review instead of failing the request. When hedge is set, the quiz
+    stage, whose occasional slow or unusable completions dominate p99, is hedged
+    (see hedging.py).
+
+    Parameters:
+    - inputs (dict): The same inputs as generate_evaluate_chain.
+    - deadline (Deadline, optional): Time budget and cancellation for the request.
+    - hedge (bool): Hedge the quiz generation stage.
+    - policy (HedgePolicy, optional): Defaults to the process-wide DEFAULT_HEDGE_POLICY.
+
+    Returns:
+    - dict: The inputs plus 'quiz', 'review' and 'fixed_quiz', like generate_evaluate_chain.
+    """
+    deadline = deadline or Deadline()
+
+    # Rendered once so both paths time it; the same call quiz_chain makes
+    with span("prompt rendering"):
+        variables = {**inputs, "schema": compact_schema(inputs["response_json"])}
+        prompt = quiz_generation_prompt.format(**{k: variables[k] for k in quiz_generation_prompt.input_variables})
+
+    async def generate(params):
+        message = await llm.ainvoke(prompt, **params)
+        return message.content
+
+    if hedge:
+        policy = policy or DEFAULT_HEDGE_POLICY
+        quiz = await _run_stage(
+            "quiz generation",
+            hedged_call(generate, lambda text: is_valid_quiz_output(text, inputs.get("number")), policy),
+            deadline
+        )
+    else:
+        quiz = await _run_stage("quiz generation", generate({}), deadline)
+
+    # Review and JSON fixing only depend on the quiz, run them concurrently
+    review_task = asyncio.ensure_future(
+        _run_stage("review", review_chain.ainvoke({
+            "compact_quiz": compact_quiz(quiz, REVIEW_EXPLANATION_CHARS),
+            "subject": inputs["subject"]
+        }), deadline)
+    )
+    try:
+        fixed = await _run_stage("JSON fixing", fix_json_chain.ainvoke({"quiz": quiz}), deadline)
+    except BaseException:
+        review_task.cancel()
+        raise
+
+    try:
+        review = (await review_task)["review"]
+    except DeadlineExceeded:
+        if deadline.cancelled:
+            raise
+        review = ""  # optional stage: degrade instead of failing the request
+
+    return {**inputs, "quiz": quiz, "review": review, "fixed_quiz": fixed["fixed_quiz"]}
+
 
+async def agenerate_evaluate_hedged(inputs, policy=None, deadline=None):
+    """Async generation with a hedged quiz stage, see agenerate_evaluate."""
+    return await agenerate_evaluate(inputs, deadline=deadline, hedge=True, policy=policy)
 
 
+def generate_evaluate(inputs, timeout=None, hedge=False, policy=None):
+    """
+    Synchronous wrapper around agenerate_evaluate for the CLI.
 
+    Parameters:
+    - timeout (float, optional): End-to-end deadline in seconds.
+    """
+    return asyncio.run(agenerate_evaluate(inputs, Deadline(timeout), hedge, policy))
 
 
+def generate_evaluate_hedged(inputs, policy=None):
+    """Synchronous wrapper around agenerate_evaluate_hedged."""
+    return generate_evaluate(inputs, hedge=True, policy=policy)
@@ -0,0 +1,547 @@
+"""
+Columnar analytics store for generated quizzes and run metadata.
+
+Three Parquet datasets, hive-partitioned so queries prune whole directories:
+- questions/date=YYYY-MM-DD/subject=<subject>/  one row per generated question
+- quizzes/date=YYYY-MM-DD/subject=<subject>/    one row per quiz (quiz_info)
+- runs/date=YYYY-MM-DD/                         one row per CLI/app run: stage latencies,
+                                                LLM calls, tokens and models (see profiling.record_run)
+
+Rows are buffered and written in batches (one new file per partition per flush),
+so the store is append-only and safe for concurrent writers. compact() merges the
+small files of a partition. query() pushes column selection and date/subject/
+arbitrary predicates down to the Parquet reader.
+
+Usage:
+  python -m src.mcq_generator.analytics summary --since 2025-07-01
+  python -m src.mcq_generator.analytics import *_questions.csv
+  python -m src.mcq_generator.analytics compact
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import glob
+import time
+import uuid
+import atexit
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.mcq_generator.profiling import current_run
+
+DEFAULT_ANALYTICS_DIR = "analytics"
+
+# Buffered rows are written once this many are pending, or FLUSH_INTERVAL seconds after the first one
+BATCH_ROWS = 5000
+FLUSH_INTERVAL = 60
+
+# compact() records the files each merged file replaces in a _compacted-<id>.json manifest
+# (pyarrow and the readers below skip "_" and "." names); manifests are kept this long so
+# that a reader listing files during a compaction never counts rows twice
+MANIFEST_RETENTION = 3600
+READ_RETRIES = 3
+
+QUESTIONS_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("quiz_id", pa.string()),
+    ("created_at", pa.timestamp("s", tz="UTC")),
+    ("question_id", pa.int32()),
+    ("question", pa.string()),
+    ("options", pa.map_(pa.string(), pa.string())),
+    ("correct_answer", pa.string()),
+    ("explanation", pa.string()),
+    ("tone", pa.string()),
+    ("section", pa.string()),
+    ("date", pa.string()),
+    ("subject", pa.string()),
+])
+
+QUIZZES_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("quiz_id", pa.string()),
+    ("created_at", pa.timestamp("s", tz="UTC")),
+    ("title", pa.string()),
+    ("difficulty", pa.string()),
+    ("tone", pa.string()),
+    ("total_questions", pa.int32()),
+    ("source", pa.string()),
+    ("document", pa.string()),
+    ("date", pa.string()),
+    ("subject", pa.string()),
+])
+
+RUNS_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("created_at", pa.timestamp("s", tz="UTC")),
+    ("source", pa.string()),
+    ("status", pa.string()),
+    ("quizzes", pa.int32()),
+    ("questions", pa.int32()),
+    ("wall_time_s", pa.float64()),
+    ("llm_calls", pa.int32()),
+    ("prompt_tokens", pa.int64()),
+    ("completion_tokens", pa.int64()),
+    ("models", pa.map_(pa.string(), pa.string())),
+    ("stages", pa.map_(pa.string(), pa.float64())),
+    ("date", pa.string()),
+])
+
+TABLES = {
+    "questions": (QUESTIONS_SCHEMA, ["date", "subject"]),
+    "quizzes": (QUIZZES_SCHEMA, ["date", "subject"]),
+    "runs": (RUNS_SCHEMA, ["date"]),
+}
+
+
+def _subject_key(subject):
+    return " ".join(str(subject or "unknown").lower().split()) or "unknown"
+
+
+def _partitioning(table):
+    schema, columns = TABLES[table]
+    return ds.partitioning(pa.schema([schema.field(c) for c in columns]), flavor="hive")
+
+
+def _write_atomic(path, text):
+    directory, name = os.path.split(path)
+    temporary = os.path.join(directory, f".{name}.tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def _manifests(path):
+    """Compaction manifests under a table directory: {manifest path: (target, replaced names)}."""
+    manifests = {}
+    for manifest in glob.glob(os.path.join(path, "**", "_compacted-*.json"), recursive=True):
+        try:
+            with open(manifest, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        manifests[manifest] = (data["target"], tuple(data["replaces"]))
+    return manifests
+
+
+def _expire_manifests(path):
+    """Drop manifests older than MANIFEST_RETENTION, finishing any compaction interrupted before its cleanup."""
+    cutoff = time.time() - MANIFEST_RETENTION
+    for manifest, (target, parts) in _manifests(path).items():
+        try:
+            if os.path.getmtime(manifest) > cutoff:
+                continue
+            directory = os.path.dirname(manifest)
+            if os.path.exists(os.path.join(directory, target)):
+                for part in parts:
+                    if os.path.exists(os.path.join(directory, part)):
+                        os.remove(os.path.join(directory, part))
+            os.remove(manifest)
+        except OSError:
+            continue
+    for temporary in glob.glob(os.path.join(path, "**", ".*.tmp"), recursive=True):
+        try:
+            if os.path.getmtime(temporary) <= cutoff:
+                os.remove(temporary)
+        except OSError:
+            continue
+
+
+class AnalyticsStore:
+    """
+    Batched writer and query interface for the analytics datasets.
+
+    Parameters:
+    - root (str): Directory holding the questions, quizzes and runs datasets.
+    - batch_rows (int): Pending rows that trigger a write.
+    - flush_interval (float): Seconds after which pending rows are written, even if no other record call arrives.
+    """
+
+    def __init__(self, root=DEFAULT_ANALYTICS_DIR, batch_rows=BATCH_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.root = root
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._pending = {table: [] for table in TABLES}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record_quiz(self, quiz, run_id, tone=None, source=None, document=None, created_at=None):
+        """
+        Buffer a generated quiz and its questions.
+
+        Parameters:
+        - quiz (dict): Quiz with quiz_info and questions, as produced by the pipeline.
+        - run_id (str, optional): The run that generated it (RunStats.run_id).
+        - tone (str, optional): Requested tone; defaults to the quiz's difficulty.
+        - source (str, optional): Where it was generated, e.g. "cli" or "app".
+        - document (str, optional): Source document name.
+
+        Returns:
+        - str: The quiz id.
+        """
+        created_at = created_at or datetime.now(timezone.utc)
+        info = quiz.get("quiz_info") or {}
+        subject = _subject_key(info.get("subject"))
+        date = created_at.strftime("%Y-%m-%d")
+        quiz_id = uuid.uuid4().hex
+        tone = tone or info.get("difficulty")
+        questions = quiz.get("questions") or []
+
+        question_rows = []
+        for number, q in enumerate(questions, 1):
+            options = q.get("options") or {}
+            question_rows.append({
+                "run_id": run_id,
+                "quiz_id": quiz_id,
+                "created_at": created_at,
+                "question_id": int(q.get("id") or number),
+                "question": str(q.get("question", "")),
+                "options": [(str(k), str(v)) for k, v in options.items()] if isinstance(options, dict) else None,
+                "correct_answer": str(q.get("correct_answer", "")),
+                "explanation": str(q.get("explanation", "")),
+                "tone": tone,
+                "section": q.get("section"),
+                "date": date,
+                "subject": subject,
+            })
+        quiz_row = {
+            "run_id": run_id,
+            "quiz_id": quiz_id,
+            "created_at": created_at,
+            "title": info.get("title"),
+            "difficulty": info.get("difficulty"),
+            "tone": tone,
+            "total_questions": len(questions),
+            "source": source,
+            "document": document,
+            "date": date,
+            "subject": subject,
+        }
+        self._append({"questions": question_rows, "quizzes": [quiz_row]})
+        return quiz_id
+
+    def record_run(self, stats, source, status="ok", created_at=None):
+        """
+        Buffer the statistics of one run.
+
+        Parameters:
+        - stats (RunStats): Collected with profiling.record_run().
+        - source (str): Where the run happened, e.g. "cli" or "app".
+        - status (str): "ok", "partial", "failed" or "cancelled".
+        """
+        created_at = created_at or datetime.now(timezone.utc)
+        self._append({"runs": [{
+            "run_id": stats.run_id,
+            "created_at": created_at,
+            "source": source,
+            "status": status,
+            "quizzes": stats.quizzes,
+            "questions": stats.questions,
+            "wall_time_s": round(stats.wall_time(), 4),
+            "llm_calls": stats.llm_calls,
+            "prompt_tokens": stats.prompt_tokens,
+            "completion_tokens": stats.completion_tokens,
+            "models": list(stats.models.items()),
+            "stages": [(name, round(seconds, 4)) for name, seconds in stats.stages.items()],
+            "date": created_at.strftime("%Y-%m-%d"),
+        }]})
+
+    def _append(self, rows_by_table):
+        with self._lock:
+            for table, rows in rows_by_table.items():
+                self._pending[table].extend(rows)
+            pending = sum(len(rows) for rows in self._pending.values())
+            if pending and self._timer is None and pending < self.batch_rows:
+                self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if pending >= self.batch_rows:
+            self.flush()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logging.exception("Timed analytics flush failed")
+
+    def flush(self):
+        """Write all pending rows; one new file per table partition."""
+        with self._lock:
+            pending = {table: rows for table, rows in self._pending.items() if rows}
+            self._pending = {table: [] for table in TABLES}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for table, rows in pending.items():
+            schema, _ = TABLES[table]
+            path = os.path.join(self.root, table)
+            batch = uuid.uuid4().hex
+            # Written under hidden names and renamed, so readers never open a partial file
+            ds.write_dataset(
+                pa.Table.from_pylist(rows, schema=schema),
+                path,
+                format="parquet",
+                partitioning=_partitioning(table),
+                basename_template=f".part-{batch}-{{i}}.parquet.tmp",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            for temporary in glob.glob(os.path.join(path, "**", f".part-{batch}-*.parquet.tmp"), recursive=True):
+                directory, name = os.path.split(temporary)
+                os.replace(temporary, os.path.join(directory, name[1:-len(".tmp")]))
+
+    def compact(self, table=None):
+        """
+        Merge the files of every partition into one, sorted by creation time.
+
+        The merged file is written under a hidden name and a manifest listing the files
+        it replaces is saved before it is renamed into place, so concurrent readers see
+        either the originals or the merged file, never both.
+
+        Returns:
+        - int: Number of partitions compacted.
+        """
+        compacted = 0
+        for name in [table] if table else list(TABLES):
+            path = os.path.join(self.root, name)
+            _expire_manifests(path)
+            by_partition = {}
+            for file in self._files(name):
+                by_partition.setdefault(os.path.dirname(file), []).append(file)
+            for directory, parts in by_partition.items():
+                if len(parts) < 2:
+                    continue
+                merged = pa.concat_tables(pq.read_table(f, partitioning=None) for f in parts)
+                merged = merged.sort_by("created_at")
+                compaction_id = uuid.uuid4().hex
+                target = f"part-{compaction_id}-compacted.parquet"
+                pq.write_table(merged, os.path.join(directory, f".{target}.tmp"))
+                _write_atomic(os.path.join(directory, f"_compacted-{compaction_id}.json"),
+                              json.dumps({"target": target, "replaces": [os.path.basename(f) for f in parts]}))
+                os.replace(os.path.join(directory, f".{target}.tmp"), os.path.join(directory, target))
+                for f in parts:
+                    os.remove(f)
+                compacted += 1
+        return compacted
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _files(self, table):
+        """Data files of a table, without those replaced by a compacted file that is already in place."""
+        path = os.path.join(self.root, table)
+        for _ in range(READ_RETRIES):
+            manifests = _manifests(path)
+            files = glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)
+            # A compaction started or finished while listing: list again
+            if _manifests(path) == manifests:
+                break
+        listed = set(files)
+        replaced = set()
+        for manifest, (target, parts) in manifests.items():
+            directory = os.path.dirname(manifest)
+            if os.path.join(directory, target) in listed:
+                replaced.update(os.path.join(directory, part) for part in parts)
+        return sorted(listed - replaced)
+
+    def dataset(self, table):
+        schema, _ = TABLES[table]
+        path = os.path.join(self.root, table)
+        return ds.dataset(self._files(table), schema=schema, format="parquet",
+                          partitioning=_partitioning(table), partition_base_dir=path)
+
+    def query(self, table, columns=None, since=None, until=None, subject=None, filter=None):
+        """
+        Read a table with partition pruning and predicate pushdown.
+
+        Parameters:
+        - table (str): "questions", "quizzes" or "runs".
+        - columns (list[str], optional): Columns to read; all by default.
+        - since, until (str, optional): Inclusive YYYY-MM-DD date bounds.
+        - subject (str, optional): Exact subject (case and spacing insensitive).
+        - filter (pyarrow.compute.Expression, optional): Extra predicate, e.g. pc.field("tone") == "Simple".
+
+        Returns:
+        - pyarrow.Table: Matching rows.
+        """
+        if not os.path.isdir(os.path.join(self.root, table)):
+            schema, _ = TABLES[table]
+            return schema.empty_table().select(columns) if columns else schema.empty_table()
+
+        expression = None
+        conditions = []
+        if since:
+            conditions.append(pc.field("date") >= since)
+        if until:
+            conditions.append(pc.field("date") <= until)
+        if subject:
+            conditions.append(pc.field("subject") == _subject_key(subject))
+        if filter is not None:
+            conditions.append(filter)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        for attempt in range(READ_RETRIES):
+            try:
+                return self.dataset(table).to_table(columns=columns, filter=expression)
+            except FileNotFoundError:
+                # A listed file was removed by a concurrent compaction
+                if attempt == READ_RETRIES - 1:
+                    raise
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+
+    def import_csv(self, questions_file, source="csv"):
+        """
+        Import a quiz saved by save_mcqs_to_csv (<base>_questions.csv with its <base>_info.csv).
+
+        Returns:
+        - str: The quiz id.
+        """
+        import pandas as pd
+
+        base = questions_file[:-len("_questions.csv")] if questions_file.endswith("_questions.csv") else questions_file
+        questions = pd.read_csv(questions_file).to_dict("records")
+        for q in questions:
+            if isinstance(q.get("options"), str):
+                q["options"] = ast.literal_eval(q["options"])
+        info_file = base + "_info.csv"
+        info = pd.read_csv(info_file).to_dict("records")[0] if os.path.exists(info_file) else {}
+
+        created_at = datetime.fromtimestamp(os.path.getmtime(questions_file), timezone.utc)
+        match = re.search(r"(\d{8}_\d{6})", os.path.basename(base))
+        if match:
+            created_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+        return self.record_quiz({"quiz_info": info, "questions": questions}, run_id=None,
+                                source=source, document=os.path.basename(base), created_at=created_at)
+
+
+_default = {"store": None}
+_default_lock = threading.Lock()
+
+
+def default_store():
+    """
+    The process-wide store at MCQ_ANALYTICS_DIR (default "analytics"), flushed at exit.
+
+    Returns:
+    - AnalyticsStore | None: None when MCQ_ANALYTICS_DIR is set to an empty string.
+    """
+    root = os.getenv("MCQ_ANALYTICS_DIR", DEFAULT_ANALYTICS_DIR)
+    if not root:
+        return None
+    with _default_lock:
+        if _default["store"] is None:
+            _default["store"] = AnalyticsStore(root)
+            atexit.register(_default["store"].flush)
+        return _default["store"]
+
+
+def record_generated_quiz(quiz, source, tone=None, document=None):
+    """
+    Count a quiz towards the current run (see profiling.record_run) and add it to the default store.
+
+    Analytics never fails a generation: write errors are logged and ignored.
+    """
+    stats = current_run()
+    if stats is not None:
+        stats.quizzes += 1
+        stats.questions += len(quiz.get("questions") or [])
+    try:
+        store = default_store()
+        if store is not None:
+            store.record_quiz(quiz, stats.run_id if stats else None, tone=tone, source=source, document=document)
+    except Exception as e:
+        logging.warning(f"Could not record quiz analytics: {e}")
+
+
+def record_finished_run(stats, source, status="ok"):
+    """Add a finished run's statistics to the default store; errors are logged and ignored."""
+    try:
+        store = default_store()
+        if store is not None:
+            store.record_run(stats, source, status)
+    except Exception as e:
+        logging.warning(f"Could not record run analytics: {e}")
+
+
+def summary(store, since=None, until=None, subject=None):
+    """Questions per date and subject, and per-stage latency and token totals of runs."""
+    lines = []
+    questions = store.query("questions", columns=["date", "subject", "quiz_id"], since=since, until=until, subject=subject)
+    lines.append(f"Questions: {questions.num_rows} in {len(pc.unique(questions['quiz_id']))} quizzes")
+    if questions.num_rows:
+        counts = questions.group_by(["date", "subject"]).aggregate([("quiz_id", "count")]).sort_by(
+            [("date", "ascending"), ("subject", "ascending")])
+        for row in counts.to_pylist():
+            lines.append(f"  {row['date']}  {row['subject']:<40} {row['quiz_id_count']:>8}")
+
+    runs = store.query("runs", since=since, until=until)
+    lines.append(f"Runs: {runs.num_rows}")
+    if runs.num_rows:
+        lines.append(f"  wall time: mean {pc.mean(runs['wall_time_s']).as_py():.2f}s, "
+                     f"max {pc.max(runs['wall_time_s']).as_py():.2f}s")
+        lines.append(f"  LLM calls: {pc.sum(runs['llm_calls']).as_py()}, tokens: "
+                     f"{pc.sum(runs['prompt_tokens']).as_py()} prompt / {pc.sum(runs['completion_tokens']).as_py()} completion")
+        # One row per run, so per-stage aggregation in Python is cheap
+        totals = {}
+        for stages in runs.column("stages").to_pylist():
+            for stage, seconds in stages or []:
+                total, count = totals.get(stage, (0.0, 0))
+                totals[stage] = (total + seconds, count + 1)
+        for stage, (total, count) in sorted(totals.items()):
+            lines.append(f"  {stage:<28} mean {total / count:>8.3f}s over {count} runs")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics store for generated quizzes and runs")
+    parser.add_argument("--root", default=os.getenv("MCQ_ANALYTICS_DIR") or DEFAULT_ANALYTICS_DIR,
+                        help=f"Store directory (default: MCQ_ANALYTICS_DIR or {DEFAULT_ANALYTICS_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = commands.add_parser("summary", help="Print question counts, run latencies and tokens")
+    summary_parser.add_argument("--since", help="First date, YYYY-MM-DD")
+    summary_parser.add_argument("--until", help="Last date, YYYY-MM-DD")
+    summary_parser.add_argument("--subject", help="Only this subject")
+
+    import_parser = commands.add_parser("import", help="Import *_questions.csv files written by save_mcqs_to_csv")
+    import_parser.add_argument("files", nargs="+")
+
+    commands.add_parser("compact", help="Merge the small files of every partition")
+
+    args = parser.parse_args()
+    store = AnalyticsStore(args.root)
+
+    if args.command == "summary":
+        print(summary(store, args.since, args.until, args.subject))
+    elif args.command == "import":
+        imported = 0
+        for file in args.files:
+            try:
+                store.import_csv(file)
+                imported += 1
+            except Exception as e:
+                print(f"Error importing {file}: {e}", file=sys.stderr)
+        store.flush()
+        print(f"Imported {imported} quizzes into {args.root}")
+    elif args.command == "compact":
+        print(f"Compacted {store.compact()} partitions in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
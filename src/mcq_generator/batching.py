@@ -0,0 +1,275 @@
+"""
+Micro-batching of small generation requests.
+
+Topic-only requests have tiny prompts, so most of their cost is per-call
+overhead and rate limiting. MicroBatcher coalesces small requests that share a
+response schema into one generation call with a keyed multi-quiz response
+({"r1": quiz, "r2": quiz, ...}), splits and validates the combined result, and
+falls back to the regular pipeline for any request whose quiz is missing or invalid.
+"""
+
+import json
+import asyncio
+
+from langchain.prompts import PromptTemplate
+
+from src.mcq_generator.MCQgenerator import llm, review_chain, agenerate_evaluate, REVIEW_EXPLANATION_CHARS
+from src.mcq_generator.hedging import parse_quiz_output
+from src.mcq_generator.variants import validate_quiz
+from src.mcq_generator.compact import compact_quiz, compact_schema
+from src.mcq_generator.retrieval import estimate_tokens
+from src.mcq_generator.deadline import Deadline, DeadlineExceeded
+from src.mcq_generator.profiling import span
+
+# Completion budget for a batched call; ~120 tokens per question with its explanation
+BATCH_MAX_TOKENS = 4096
+
+TEMPLATE_BATCH = """
+# Batch MCQ Generation Instructions
+
+## Requests
+{requests}
+
+## Task Description
+You are an expert MCQ maker. Create one independent quiz for each request above, based on that request's text.
+
+## Requirements
+1. **Question Count**: Each quiz has exactly the number of MCQs its request asks for
+2. **Uniqueness**: Ensure no questions are repeated within a quiz
+3. **Accuracy**: All questions must conform to their request's text, subject and tone
+4. **Format**: Follow the RESPONSE_JSON structure below exactly for every quiz
+
+## Response Format
+Return one JSON object whose keys are the request keys ({keys}) and whose values each follow RESPONSE_JSON:
+
+### RESPONSE_JSON
+{schema}
+
+Values give the type or the allowed values; `correct_answer` is one of the `options` keys.
+Return only the JSON object.
+"""
+
+batch_generation_prompt = PromptTemplate(
+    input_variables=["requests", "keys", "schema"],
+    template=TEMPLATE_BATCH
+)
+
+
+def render_batch_prompt(batch):
+    """Build the batched generation prompt for a list of request inputs."""
+    keys = [f"r{i}" for i in range(1, len(batch) + 1)]
+    requests = "\n".join(
+        f"### {key}\nText: {inputs['text']}\n"
+        f"Questions: {inputs['number']} | Subject: {inputs['subject']} | Tone: {inputs['tone']}\n"
+        for key, inputs in zip(keys, batch)
+    )
+    prompt = batch_generation_prompt.format(
+        requests=requests,
+        keys=", ".join(f'"{key}"' for key in keys),
+        schema=compact_schema(batch[0]["response_json"])
+    )
+    return keys, prompt
+
+
+def split_batch_output(text, keys, batch):
+    """
+    Split a batched completion into per-request quizzes.
+
+    Returns:
+    - list[dict | None]: The validated quiz for each request, or None where the
+      quiz is missing, malformed or has the wrong number of questions.
+    """
+    combined = parse_quiz_output(text)
+    if isinstance(combined, dict) and "questions" in combined and len(keys) == 1:
+        combined = {keys[0]: combined}
+    if not isinstance(combined, dict):
+        return [None] * len(keys)
+
+    quizzes = []
+    for key, inputs in zip(keys, batch):
+        quiz = combined.get(key)
+        try:
+            validate_quiz(quiz)
+            if len(quiz["questions"]) != int(inputs["number"]):
+                raise Exception("wrong number of questions")
+        except Exception:
+            quiz = None
+        quizzes.append(quiz)
+    return quizzes
+
+
+class MicroBatcher:
+    """
+    Coalescing scheduler for generation requests.
+
+    Parameters:
+    - max_batch_size (int): Maximum requests packed into one call.
+    - max_batch_questions (int): Maximum questions across a batch (bounded by BATCH_MAX_TOKENS).
+    - max_wait (float): Seconds a request waits for companions before its batch is sent.
+    - small_text_tokens (int): Requests with longer text are not batched.
+    - max_concurrency (int): Maximum LLM calls in flight.
+    - review (bool): Also review batched quizzes (one review call each); off by default
+      because the review is advisory and would undo most of the saving.
+    - deadline (Deadline, optional): Time budget and cancellation shared by all requests.
+    - hedge (bool): Hedge the quiz generation of requests that are generated on their own.
+    - policy (HedgePolicy, optional): Defaults to the process-wide DEFAULT_HEDGE_POLICY.
+    """
+
+    def __init__(self, max_batch_size=4, max_batch_questions=25, max_wait=0.05,
+                 small_text_tokens=500, max_concurrency=4, review=False,
+                 deadline=None, hedge=False, policy=None):
+        self.max_batch_size = max_batch_size
+        self.max_batch_questions = max_batch_questions
+        self.max_wait = max_wait
+        self.small_text_tokens = small_text_tokens
+        self.review = review
+        self.deadline = deadline or Deadline()
+        self.hedge = hedge
+        self.policy = policy
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = {}
+        self._timers = {}
+        self._running = set()
+        self.stats = {"requests": 0, "llm_calls": 0, "batches": 0, "batched_requests": 0, "fallbacks": 0,
+                      "unreviewed": 0}
+
+    def packing_factor(self):
+        """Average number of requests served per batched generation call."""
+        return self.stats["batched_requests"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+    async def submit(self, inputs):
+        """
+        Generate a quiz for one request, possibly sharing the call with others.
+
+        Returns:
+        - dict: The inputs plus 'quiz', 'review' and 'fixed_quiz', like agenerate_evaluate,
+          and 'batched' telling whether the quiz came from a shared call.
+        """
+        self.stats["requests"] += 1
+        if estimate_tokens(str(inputs["text"])) > self.small_text_tokens:
+            return await self._individual(inputs)
+
+        future = asyncio.get_running_loop().create_future()
+        key = inputs["response_json"]
+        pending = self._pending.setdefault(key, [])
+        questions = sum(int(i["number"]) for i, _ in pending) + int(inputs["number"])
+        if pending and questions > self.max_batch_questions:
+            self._flush(key)
+            pending = self._pending.setdefault(key, [])
+
+        pending.append((inputs, future))
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch):
+        if len(batch) == 1:
+            inputs, future = batch[0]
+            await self._resolve(future, self._individual(inputs))
+            return
+
+        requests = [inputs for inputs, _ in batch]
+        keys, prompt = render_batch_prompt(requests)
+        try:
+            async with self._semaphore:
+                self.stats["llm_calls"] += 1
+                with span("batched quiz generation"):
+                    message = await self.deadline.run(
+                        llm.ainvoke(prompt, max_tokens=BATCH_MAX_TOKENS), "batched quiz generation"
+                    )
+            quizzes = split_batch_output(message.content, keys, requests)
+        except DeadlineExceeded as e:
+            # Out of time: generating the requests one by one would fail as well
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception:
+            quizzes = [None] * len(batch)
+
+        self.stats["batches"] += 1
+        jobs = []
+        for (inputs, future), quiz in zip(batch, quizzes):
+            if quiz is None:
+                self.stats["fallbacks"] += 1
+                jobs.append(self._resolve(future, self._individual(inputs)))
+            else:
+                self.stats["batched_requests"] += 1
+                jobs.append(self._resolve(future, self._finish(inputs, quiz)))
+        await asyncio.gather(*jobs)
+
+    async def _finish(self, inputs, quiz):
+        # The quiz is already valid JSON, so the JSON fixing stage is not needed
+        quiz_json = json.dumps(quiz, ensure_ascii=False)
+        review = ""
+        if self.review:
+            try:
+                async with self._semaphore:
+                    self.stats["llm_calls"] += 1
+                    with span("review"):
+                        result = await self.deadline.run(review_chain.ainvoke({
+                            "compact_quiz": compact_quiz(quiz, REVIEW_EXPLANATION_CHARS),
+                            "subject": inputs["subject"]
+                        }), "review")
+                review = result["review"]
+            except DeadlineExceeded:
+                if self.deadline.cancelled:
+                    raise
+        if not review:
+            self.stats["unreviewed"] += 1
+        return {**inputs, "quiz": quiz_json, "review": review, "fixed_quiz": quiz_json, "batched": True}
+
+    async def _individual(self, inputs):
+        async with self._semaphore:
+            # Generation, review and JSON fixing
+            self.stats["llm_calls"] += 3
+            result = await agenerate_evaluate(inputs, self.deadline, self.hedge, self.policy)
+        return {**result, "batched": False}
+
+    @staticmethod
+    async def _resolve(future, coroutine):
+        try:
+            result = await coroutine
+        except asyncio.CancelledError:
+            # Cancelling a batch cancels its waiting submit() calls instead of leaving them pending
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+
+async def agenerate_many(requests, **batcher_options):
+    """
+    Generate quizzes for many requests through one MicroBatcher.
+
+    Parameters:
+    - requests (list[dict]): Inputs for agenerate_evaluate, one per request.
+    - batcher_options: Passed to MicroBatcher.
+
+    Returns:
+    - tuple: (results in request order, with exceptions in place of failed requests; the batcher)
+    """
+    batcher = MicroBatcher(**batcher_options)
+    results = await asyncio.gather(*(batcher.submit(inputs) for inputs in requests), return_exceptions=True)
+    return results, batcher
+
+
+def generate_many(requests, **batcher_options):
+    """Synchronous wrapper around agenerate_many for the CLI."""
+    return asyncio.run(agenerate_many(requests, **batcher_options))
@@ -0,0 +1,254 @@
+"""
+Record/replay cassettes for the LLM calls of the pipeline.
+
+In record mode every request made through a wrapped chat model is forwarded to
+the real model and appended, with its latency, to a gzip-compressed JSON Lines
+cassette. In replay mode the same requests are answered from the cassette,
+optionally sleeping for the original latency times a scale factor, so parsing,
+repair, export and UI stages can be benchmarked offline at production shape.
+
+Cassettes are activated with the MCQ_CASSETTE / MCQ_CASSETTE_MODE environment
+variables or programmatically with use_cassette().
+"""
+
+import os
+import gzip
+import asyncio
+import json
+import time
+import hashlib
+import threading
+from collections import defaultdict, deque
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.mcq_generator.profiling import record_usage
+
+MODES = ("record", "replay")
+
+
+def request_key(llm_name, messages, params=None):
+    """
+    Stable hash of an LLM request: the wrapped model's name, its prompt messages and
+    the call parameters (stop sequences and overrides such as temperature or max_tokens).
+
+    Calls without parameters hash as they did before parameters were included, so
+    older cassettes keep replaying.
+    """
+    request = [llm_name, [[m.type, m.content] for m in messages]]
+    if params:
+        request.append(params)
+    payload = json.dumps(request, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    A cassette file of recorded LLM interactions.
+
+    Parameters:
+    - path (str): The cassette file (.jsonl.gz).
+    - mode (str): "record" appends new interactions, "replay" serves recorded ones.
+    - latency_scale (float): Replay sleeps for the recorded latency times this factor (0 disables).
+    - match (str): "exact" serves only identical requests; "sequential" falls back to the next
+      unused recording of the same model, which replays production traffic shape for new inputs.
+    """
+
+    def __init__(self, path, mode="replay", latency_scale=1.0, match="exact"):
+        if mode not in MODES:
+            raise Exception(f"unknown cassette mode {mode!r}, expected one of {MODES}")
+        if match not in ("exact", "sequential"):
+            raise Exception(f"unknown cassette match {match!r}, expected 'exact' or 'sequential'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.match = match
+        self._lock = threading.Lock()
+        self._by_key = defaultdict(deque)
+        self._by_llm = defaultdict(deque)
+
+        if mode == "replay":
+            self._load()
+        else:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise Exception(f"cassette not found: {self.path}")
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._by_key[entry["key"]].append(entry)
+                    self._by_llm[entry["llm"]].append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._by_llm.values())
+
+    def record(self, llm_name, messages, response, latency, llm_output=None, params=None):
+        """Append one interaction to the cassette."""
+        entry = {
+            "key": request_key(llm_name, messages, params),
+            "llm": llm_name,
+            "messages": [[m.type, m.content] for m in messages],
+            "params": params or {},
+            "response": response,
+            "latency": round(latency, 4),
+            "llm_output": llm_output or {},
+            "recorded_at": time.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            # Every append is a separate gzip member; gzip readers concatenate them transparently
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+    def next_entry(self, llm_name, messages, params=None):
+        """
+        Return the recorded entry for a request without sleeping.
+
+        Identical requests recorded several times are served in recording order and
+        wrap around once exhausted.
+        """
+        key = request_key(llm_name, messages, params)
+        with self._lock:
+            queue = self._by_key.get(key)
+            if not queue and self.match == "sequential":
+                queue = self._by_llm.get(llm_name)
+            if not queue:
+                raise Exception(f"no recorded response for {llm_name} request {key[:12]} in {self.path}")
+            entry = queue.popleft()
+            queue.append(entry)
+        return entry
+
+    def replay_delay(self, entry):
+        return entry["latency"] * self.latency_scale if self.latency_scale > 0 else 0.0
+
+    def play(self, llm_name, messages, params=None):
+        """Return the recorded entry for a request after its (scaled) recorded latency."""
+        entry = self.next_entry(llm_name, messages, params)
+        time.sleep(self.replay_delay(entry))
+        return entry
+
+    async def aplay(self, llm_name, messages, params=None):
+        """Async play(); cancelling the caller interrupts the simulated latency."""
+        entry = self.next_entry(llm_name, messages, params)
+        await asyncio.sleep(self.replay_delay(entry))
+        return entry
+
+
+_active = {"cassette": None}
+
+
+def use_cassette(path, mode="replay", latency_scale=1.0, match="exact"):
+    """
+    Activate a cassette for every wrapped model in this process.
+
+    Returns:
+    - Cassette: The active cassette.
+    """
+    _active["cassette"] = Cassette(path, mode, latency_scale, match)
+    return _active["cassette"]
+
+
+def eject_cassette():
+    """Go back to live LLM calls."""
+    _active["cassette"] = None
+
+
+def active_cassette():
+    return _active["cassette"]
+
+
+def _call_params(stop, kwargs):
+    """The parameters of a call that change its response, for the request key."""
+    params = dict(kwargs)
+    if stop:
+        params["stop"] = list(stop)
+    return params
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model wrapper that records to or replays from the active cassette.
+
+    With no active cassette it is a transparent pass-through to the wrapped model.
+    """
+
+    inner: Any
+    llm_name: str
+
+    @property
+    def _llm_type(self):
+        return "cassette"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        result = self._generate_or_replay(messages, stop, run_manager, **kwargs)
+        record_usage(self.llm_name, result.llm_output)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        result = await self._agenerate_or_replay(messages, stop, run_manager, **kwargs)
+        record_usage(self.llm_name, result.llm_output)
+        return result
+
+    def _generate_or_replay(self, messages, stop, run_manager, **kwargs):
+        cassette = _active["cassette"]
+        if cassette is None:
+            return self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        if cassette.mode == "replay":
+            entry = cassette.play(self.llm_name, messages, _call_params(stop, kwargs))
+            return ChatResult(
+                generations=[ChatGeneration(message=AIMessage(content=entry["response"]))],
+                llm_output=entry.get("llm_output") or None,
+            )
+
+        started = time.perf_counter()
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        latency = time.perf_counter() - started
+        cassette.record(self.llm_name, messages, result.generations[0].message.content, latency, result.llm_output,
+                        _call_params(stop, kwargs))
+        return result
+
+    async def _agenerate_or_replay(self, messages, stop, run_manager, **kwargs):
+        # Delegate to the wrapped model's native async path so that cancelling the
+        # calling task also cancels the in-flight HTTP request
+        cassette = _active["cassette"]
+        if cassette is None:
+            return await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        if cassette.mode == "replay":
+            entry = await cassette.aplay(self.llm_name, messages, _call_params(stop, kwargs))
+            return ChatResult(
+                generations=[ChatGeneration(message=AIMessage(content=entry["response"]))],
+                llm_output=entry.get("llm_output") or None,
+            )
+
+        started = time.perf_counter()
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        latency = time.perf_counter() - started
+        cassette.record(self.llm_name, messages, result.generations[0].message.content, latency, result.llm_output,
+                        _call_params(stop, kwargs))
+        return result
+
+
+def wrap_llm(llm, llm_name):
+    """Wrap a chat model so that it honours the active cassette."""
+    return CassetteChatModel(inner=llm, llm_name=llm_name)
+
+
+# Environment toggle, e.g. MCQ_CASSETTE=cassettes/run.jsonl.gz MCQ_CASSETTE_MODE=replay
+if os.getenv("MCQ_CASSETTE"):
+    use_cassette(
+        os.getenv("MCQ_CASSETTE"),
+        mode=os.getenv("MCQ_CASSETTE_MODE", "replay"),
+        latency_scale=float(os.getenv("MCQ_CASSETTE_LATENCY_SCALE", "1.0")),
+        match=os.getenv("MCQ_CASSETTE_MATCH", "exact"),
+    )
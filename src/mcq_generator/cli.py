@@ -4,12 +4,23 @@ Command Line Interface for MCQ Generator
 """
 
 import argparse
+import csv
 import sys
 from pathlib import Path
 import json
+from datetime import datetime
 from dotenv import load_dotenv
-from src.mcq_generator.MCQgenerator import generate_evaluate_chain
-from src.mcq_generator.utils import save_mcqs_to_csv
+from src.mcq_generator.MCQgenerator import generate_evaluate
+from src.mcq_generator.deadline import Deadline, DeadlineExceeded
+from src.mcq_generator.profiling import Profiler, span, record_run
+from src.mcq_generator.analytics import record_generated_quiz, record_finished_run
+from src.mcq_generator.compact import compact_schema
+from src.mcq_generator.hedging import DEFAULT_HEDGE_POLICY
+from src.mcq_generator.utils import read_file, save_mcqs_to_csv
+from src.mcq_generator.variants import generate_variants, save_variants
+from src.mcq_generator.cassette import use_cassette
+from src.mcq_generator.batching import generate_many
+from src.mcq_generator.incremental import regenerate, DEFAULT_STORE_DIR, TOKENS_PER_QUESTION
 
 def main():
     parser = argparse.ArgumentParser(
@@ -19,6 +30,12 @@ def main():
 Examples:
   python cli.py --topic "Python Basics" --num-questions 5
   python cli.py --topic "Data Structures" --difficulty hard --subject "computer science"
+  python cli.py --topic "Algebra" -n 20 --variants 30 --variant-questions 10 --seed 7
+  python cli.py --topic "Python Basics" --record cassettes/python.jsonl.gz
+  python cli.py --topic "Python Basics" --replay cassettes/python.jsonl.gz --latency-scale 0
+  python cli.py --topic "Python Basics" --profile reports/slow_run.zip
+  python cli.py --batch topics.csv --max-batch-size 4
+  python cli.py --document textbook.pdf --subject biology
         """
     )
     
@@ -65,19 +82,185 @@ Examples:
         help="Output format (default: all)"
     )
     
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=0,
+        help="Also write this many shuffled quiz variants with answer keys (no extra API calls)"
+    )
+    
+    parser.add_argument(
+        "--variant-questions",
+        type=int,
+        default=None,
+        help="Questions sampled from the generated pool for each variant (default: all)"
+    )
+    
+    parser.add_argument(
+        "--seed",
+        type=str,
+        default="0",
+        help="Seed for reproducible variants (default: 0)"
+    )
+    
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument(
+        "--record",
+        type=str,
+        metavar="CASSETTE",
+        help="Record every LLM request/response with timings to this cassette file"
+    )
+    cassette_group.add_argument(
+        "--replay",
+        type=str,
+        metavar="CASSETTE",
+        help="Serve LLM responses from this cassette file instead of the Groq API"
+    )
+    
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Replay latency as a multiple of the recorded latency, 0 for none (default: 1.0)"
+    )
+    
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Launch a backup generation request when the first one is slow or invalid"
+    )
+    
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=95,
+        help="Hedge after this percentile of recent generation latency (default: 95)"
+    )
+    
+    parser.add_argument(
+        "--hedge-temperature",
+        type=float,
+        default=None,
+        help="Temperature for the backup request (default: same as the first request)"
+    )
+    
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="End-to-end deadline in seconds for the run, covering every topic with --batch and every "
+             "section with --document; stages still running are cancelled (default: none)"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="REPORT",
+        help="Profile the run and write a report zip (cProfile stats, memory, collapsed stacks, stage timings)"
+    )
+    
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="FILE",
+        help="Generate quizzes for many topics from a CSV or JSONL file with columns "
+             "topic, num_questions, subject, difficulty; small requests share LLM calls"
+    )
+    
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=4,
+        help="Maximum topic requests packed into one LLM call with --batch (default: 4)"
+    )
+    
+    parser.add_argument(
+        "--document",
+        type=str,
+        metavar="FILE",
+        help="Generate questions section by section from a document; re-running on a "
+             "revised version only regenerates the sections that changed"
+    )
+    
+    parser.add_argument(
+        "--sections-dir",
+        type=str,
+        default=DEFAULT_STORE_DIR,
+        help=f"Where --document keeps its per-section questions (default: {DEFAULT_STORE_DIR})"
+    )
+    
+    parser.add_argument(
+        "--tokens-per-question",
+        type=int,
+        default=TOKENS_PER_QUESTION,
+        help=f"Document tokens per generated question with --document (default: {TOKENS_PER_QUESTION})"
+    )
+    
     args = parser.parse_args()
     
-    if not args.topic:
+    if not args.topic and not args.batch and not args.document:
         parser.print_help()
         sys.exit(1)
     
-    if not 1 <= args.num_questions <= 20:
-        print("Error: Number of questions must be between 1 and 20")
-        sys.exit(1)
+    command = run_batch if args.batch else run_document if args.document else run
+    
+    # Every run's stage latencies, tokens and quizzes go to the analytics store (see analytics.py)
+    with record_run() as stats:
+        status = "failed"
+        try:
+            profile(command, args)
+            status = "ok"
+        except SystemExit as e:
+            if not e.code:
+                status = "ok"
+            elif stats.quizzes:
+                status = "partial"
+            raise
+        except KeyboardInterrupt:
+            status = "cancelled"
+            raise
+        finally:
+            record_finished_run(stats, "cli", status)
+
+def profile(command, args):
+    """Run a command, under the profiler if --profile was given."""
+    if args.profile is None:
+        command(args)
+        return
+    
+    profiler = Profiler()
+    try:
+        with profiler:
+            command(args)
+    finally:
+        report = args.profile or str(Path(args.output_dir) / f"mcq_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+        try:
+            profiler.write_report(report)
+            print(f"Profile saved: {report}")
+        except Exception as e:
+            print(f"Warning: could not write profile {report}: {e}")
+
+def prepare(args):
+    """
+    Set up a generation command: environment, cassette and hedging options.
     
+    Returns:
+    - str: The compact Response.json schema for the prompts.
+    """
     # Load environment variables
     load_dotenv()
     
+    try:
+        if args.record:
+            use_cassette(args.record, mode="record")
+        elif args.replay:
+            use_cassette(args.replay, mode="replay", latency_scale=args.latency_scale)
+    except Exception as e:
+        print(f"Error loading cassette: {e}")
+        sys.exit(1)
+    
     # Load response JSON schema
     try:
         with open("Response.json", "r") as f:
@@ -86,6 +269,21 @@ Examples:
         print(f"Error loading Response.json: {e}")
         sys.exit(1)
     
+    if args.hedge:
+        DEFAULT_HEDGE_POLICY.percentile = args.hedge_percentile
+        if args.hedge_temperature is not None:
+            DEFAULT_HEDGE_POLICY.hedge_params["temperature"] = args.hedge_temperature
+    return compact_schema(response_json)
+
+def run(args):
+    """Generate and save MCQs for parsed command line arguments."""
+    
+    if not 1 <= args.num_questions <= 20:
+        print("Error: Number of questions must be between 1 and 20")
+        sys.exit(1)
+    
+    response_json = prepare(args)
+    
     # Create output directory if it doesn't exist
     output_path = Path(args.output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
@@ -93,18 +291,28 @@ Examples:
     print(f"Generating {args.num_questions} {args.difficulty} MCQs on '{args.topic}'...")
     
     # Generate MCQs
+    inputs = {
+        "text": args.topic,
+        "number": args.num_questions,
+        "subject": args.subject,
+        "tone": args.difficulty.capitalize(),
+        "response_json": response_json
+    }
+    
     try:
-        result = generate_evaluate_chain({
-            "text": args.topic,
-            "number": args.num_questions,
-            "subject": args.subject,
-            "tone": args.difficulty.capitalize(),
-            "response_json": json.dumps(response_json)
-        })
+        result = generate_evaluate(inputs, timeout=args.timeout, hedge=args.hedge)
+    except DeadlineExceeded as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"Error generating MCQs: {e}")
         sys.exit(1)
     
+    if args.hedge:
+        print(f"Hedging: {DEFAULT_HEDGE_POLICY.metrics.snapshot()}")
+    if not result.get("review"):
+        print("Warning: the quiz review did not finish in time and was skipped.")
+    
     quiz_json = result.get("fixed_quiz")
     if not quiz_json:
         print("Error: No MCQs generated.")
@@ -112,20 +320,27 @@ Examples:
     
     # Parse the quiz JSON
     try:
-        parsed_mcqs = json.loads(quiz_json)
+        with span("JSON parsing"):
+            parsed_mcqs = json.loads(quiz_json)
     except Exception as e:
         print(f"Error parsing generated MCQs: {e}")
         sys.exit(1)
     
+    record_generated_quiz(parsed_mcqs, "cli", tone=inputs["tone"])
+    save_outputs(parsed_mcqs, quiz_json, args.topic, args, output_path)
+    print(f"Successfully generated and saved {len(parsed_mcqs.get('questions', []))} MCQs!")
+
+def save_outputs(parsed_mcqs, quiz_json, topic, args, output_path):
+    """Save one generated quiz in the requested format(s), plus its variants."""
+    
     # Create timestamp for unique filenames
-    from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_topic = args.topic.replace(' ', '_').lower().replace('/', '_')
+    safe_topic = topic.replace(' ', '_').lower().replace('/', '_')
     filename_base = f"mcqs_{safe_topic}_{timestamp}"
     
     # Save in specified format(s)
     if args.format in ["json", "all"]:
-        with open(output_path / f"{filename_base}.json", "w", encoding="utf-8") as f:
+        with span("export: JSON"), open(output_path / f"{filename_base}.json", "w", encoding="utf-8") as f:
             json.dump(parsed_mcqs, f, ensure_ascii=False, indent=2)
         print(f"Saved: {output_path / f'{filename_base}.json'}")
     
@@ -133,7 +348,7 @@ Examples:
         save_mcqs_to_csv(quiz_json, str(output_path / filename_base))
     
     if args.format in ["txt", "all"]:
-        with open(output_path / f"{filename_base}.txt", "w", encoding="utf-8") as f:
+        with span("export: TXT"), open(output_path / f"{filename_base}.txt", "w", encoding="utf-8") as f:
             for i, q in enumerate(parsed_mcqs.get("questions", []), 1):
                 f.write(f"Question {i}: {q.get('question', '')}\n")
                 for key, value in q.get("options", {}).items():
@@ -143,7 +358,138 @@ Examples:
                 f.write("-"*50 + "\n")
         print(f"Saved: {output_path / f'{filename_base}.txt'}")
     
-    print(f"Successfully generated and saved {len(parsed_mcqs.get('questions', []))} MCQs!")
+    if args.variants > 0:
+        try:
+            variants = generate_variants(
+                parsed_mcqs,
+                args.variants,
+                seed=args.seed,
+                questions_per_variant=args.variant_questions
+            )
+        except Exception as e:
+            print(f"Error generating quiz variants: {e}")
+            sys.exit(1)
+        save_variants(variants, str(output_path / f"{filename_base}_variants.json"))
+
+def load_batch(path, args):
+    """Read topic requests from a CSV or JSONL file, defaulting missing fields from args."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    
+    requests = []
+    for row in rows:
+        difficulty = row.get("difficulty") or args.difficulty
+        requests.append({
+            "topic": row["topic"],
+            "number": int(row.get("num_questions") or args.num_questions),
+            "subject": row.get("subject") or args.subject,
+            "tone": difficulty.capitalize(),
+        })
+    return requests
+
+def run_batch(args):
+    """Generate and save MCQs for every topic in the --batch file."""
+    
+    response_json = prepare(args)
+    try:
+        requests = load_batch(args.batch, args)
+    except Exception as e:
+        print(f"Error loading batch: {e}")
+        sys.exit(1)
+    
+    if not all(1 <= r["number"] <= 20 for r in requests):
+        print("Error: Number of questions must be between 1 and 20")
+        sys.exit(1)
+    
+    output_path = Path(args.output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    print(f"Generating MCQs for {len(requests)} topics...")
+    inputs = [
+        {"text": r["topic"], "number": r["number"], "subject": r["subject"], "tone": r["tone"],
+         "response_json": response_json}
+        for r in requests
+    ]
+    started = datetime.now()
+    results, batcher = generate_many(
+        inputs, max_batch_size=args.max_batch_size, deadline=Deadline(args.timeout), hedge=args.hedge
+    )
+    elapsed = (datetime.now() - started).total_seconds()
+    
+    failed = 0
+    for request, result in zip(requests, results):
+        try:
+            if isinstance(result, Exception):
+                raise result
+            quiz_json = result["fixed_quiz"]
+            parsed_mcqs = json.loads(quiz_json)
+        except Exception as e:
+            failed += 1
+            print(f"Error generating MCQs for '{request['topic']}': {e}")
+            continue
+        record_generated_quiz(parsed_mcqs, "cli", tone=request["tone"])
+        save_outputs(parsed_mcqs, quiz_json, request["topic"], args, output_path)
+    
+    stats = batcher.stats
+    print(f"Batching: {stats['llm_calls']} LLM calls for {stats['requests']} topics, "
+          f"{stats['batches']} shared calls packing {batcher.packing_factor():.1f} topics each, "
+          f"{stats['fallbacks']} fallbacks")
+    # Unbatched, every topic takes a generation, a JSON fixing and a review call
+    print(f"Unbatched: {3 * stats['requests']} LLM calls, or {2 * stats['requests']} without reviews")
+    if stats["unreviewed"]:
+        print(f"Warning: {stats['unreviewed']} batched quizzes were not reviewed.")
+    if args.hedge:
+        print(f"Hedging: {DEFAULT_HEDGE_POLICY.metrics.snapshot()}")
+    print(f"Generated {len(requests) - failed}/{len(requests)} quizzes in {elapsed:.1f}s "
+          f"({60 * (len(requests) - failed) / max(elapsed, 1e-9):.0f} quizzes/minute)")
+    if failed:
+        sys.exit(1)
+
+def run_document(args):
+    """Generate and save MCQs for a document, reusing questions of unchanged sections."""
+    
+    response_json = prepare(args)
+    try:
+        text = read_file(args.document)
+    except Exception as e:
+        print(f"Error reading document: {e}")
+        sys.exit(1)
+    
+    output_path = Path(args.output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    document_id = Path(args.document).name
+    print(f"Generating {args.difficulty} MCQs for '{document_id}'...")
+    try:
+        parsed_mcqs, stats = regenerate(
+            text, document_id, args.subject, args.difficulty.capitalize(), response_json,
+            timeout=args.timeout,
+            hedge=args.hedge,
+            store_dir=args.sections_dir,
+            tokens_per_question=args.tokens_per_question
+        )
+    except DeadlineExceeded as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error generating MCQs: {e}")
+        sys.exit(1)
+    
+    print(f"Sections: {stats['sections']} ({stats['reused']} unchanged, {stats['generated']} generated, "
+          f"{stats['failed']} failed, {stats['removed']} removed since the last run)")
+    if args.hedge:
+        print(f"Hedging: {DEFAULT_HEDGE_POLICY.metrics.snapshot()}")
+    
+    record_generated_quiz(parsed_mcqs, "cli", tone=args.difficulty.capitalize(), document=document_id)
+    quiz_json = json.dumps(parsed_mcqs, ensure_ascii=False)
+    save_outputs(parsed_mcqs, quiz_json, Path(args.document).stem, args, output_path)
+    print(f"Successfully generated and saved {len(parsed_mcqs['questions'])} MCQs!")
+    if stats["failed"]:
+        print("Warning: some sections failed; re-run to retry them.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Token-minimal renderings of the quiz and of the response schema for prompts.
+"""
+
+import re
+import json
+
+from src.mcq_generator.hedging import parse_quiz_output
+
+# Leaf values kept as-is by compact_schema, so compacting is idempotent
+TYPE_PLACEHOLDERS = ("str", "int", "float", "bool")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _terse(text):
+    return _WHITESPACE_RE.sub(" ", str(text)).strip()
+
+
+def _schema_leaf(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    value = str(value)
+    if value in TYPE_PLACEHOLDERS or "|" in value:
+        return value
+    if "/" in value:
+        # "easy/medium/hard" -> "easy|medium|hard"
+        return "|".join(part.strip() for part in value.split("/"))
+    return "str"
+
+
+def _schema_shape(node):
+    if isinstance(node, dict):
+        return {key: _schema_shape(value) for key, value in node.items()}
+    if isinstance(node, list):
+        # One element is enough to describe the item shape
+        return [_schema_shape(node[0])] if node else []
+    return _schema_leaf(node)
+
+
+def compact_schema(response_json):
+    """
+    Minimal description of the response format for the generation prompt.
+
+    Example values are replaced by type placeholders, lists keep one item and the
+    JSON is serialised without whitespace. Compute it once at startup and pass it
+    as the response_json input.
+
+    Parameters:
+    - response_json (dict | str): The Response.json structure or its JSON string.
+
+    Returns:
+    - str: The compact schema as a JSON string.
+    """
+    if isinstance(response_json, str):
+        response_json = json.loads(response_json)
+    return json.dumps(_schema_shape(response_json), ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_quiz(quiz, explanation_chars=0):
+    """
+    Terse rendering of a quiz for the review prompt.
+
+    One header line, then per question the stem and a single line with the options
+    and the answer key. Explanations are dropped (explanation_chars=0) or cut to
+    explanation_chars characters. Text that cannot be parsed as a quiz is returned
+    unchanged, so the reviewer always sees the quiz.
+
+    Parameters:
+    - quiz (dict | str): The quiz, or the raw quiz completion.
+    - explanation_chars (int): Maximum explanation length; 0 omits explanations.
+
+    Returns:
+    - str: The compact quiz.
+    """
+    parsed = parse_quiz_output(quiz) if isinstance(quiz, str) else quiz
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("questions"), list):
+        return quiz if isinstance(quiz, str) else json.dumps(quiz, ensure_ascii=False)
+
+    info = parsed.get("quiz_info") or {}
+    header = " | ".join(_terse(info[key]) for key in ("title", "subject", "difficulty") if info.get(key))
+    lines = [header] if header else []
+
+    for number, q in enumerate(parsed["questions"], 1):
+        if not isinstance(q, dict):
+            continue
+        lines.append(f"{q.get('id', number)}. {_terse(q.get('question', ''))}")
+        options = q.get("options") or {}
+        parts = [f"{key}) {_terse(value)}" for key, value in options.items()] if isinstance(options, dict) \
+            else [_terse(value) for value in options]
+        parts.append(f"ans {q.get('correct_answer', '?')}")
+        explanation = _terse(q.get("explanation", ""))
+        if explanation_chars > 0 and explanation:
+            if len(explanation) > explanation_chars:
+                explanation = explanation[:explanation_chars].rstrip() + "…"
+            parts.append(f"why: {explanation}")
+        lines.append(" | ".join(parts))
+    return "\n".join(lines)
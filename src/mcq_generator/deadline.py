@@ -0,0 +1,128 @@
+"""
+Per-request deadlines and cancellation for the generation pipeline.
+
+A Deadline is created once per request and passed through extraction, every LLM
+stage and export. Synchronous stages call check() between units of work; async
+stages are wrapped with run(), which cancels the awaited call (and with it the
+in-flight HTTP request) when the deadline passes. BackgroundJob runs a pipeline
+coroutine on its own thread and event loop so that a UI can cancel it at once.
+"""
+
+import time
+import asyncio
+import threading
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time or is cancelled."""
+
+
+class Deadline:
+    """
+    Time budget for one request.
+
+    Parameters:
+    - seconds (float, optional): Budget from now; None means no time limit (cancellation still works).
+    """
+
+    def __init__(self, seconds=None):
+        self.started = time.monotonic()
+        self.expires_at = None if seconds is None else self.started + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        """Seconds left, or None when unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self.cancelled or (self.expires_at is not None and time.monotonic() >= self.expires_at)
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if the request was cancelled or is out of time."""
+        if self.cancelled:
+            raise DeadlineExceeded(f"request cancelled during {stage}")
+        if self.expired():
+            raise DeadlineExceeded(f"deadline exceeded during {stage} after {self.elapsed():.1f}s")
+
+    async def run(self, awaitable, stage):
+        """
+        Await a stage within the remaining time.
+
+        The awaited task is cancelled when the deadline passes, and DeadlineExceeded is raised.
+        """
+        try:
+            self.check(stage)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"deadline exceeded during {stage} after {self.elapsed():.1f}s")
+
+
+class BackgroundJob:
+    """
+    Run a coroutine on a daemon thread with its own event loop.
+
+    cancel() cancels the running task immediately (closing in-flight LLM requests)
+    and marks the deadline as cancelled so synchronous stages stop at their next check.
+    """
+
+    def __init__(self, coroutine_factory, deadline=None):
+        self.deadline = deadline or Deadline()
+        self._factory = coroutine_factory
+        self._loop = asyncio.new_event_loop()
+        self._task = None
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._task = self._loop.create_task(self._factory(self.deadline))
+            self._result = self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            self._error = DeadlineExceeded("request cancelled")
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._loop.close()
+            self._done.set()
+
+    def cancel(self):
+        self.deadline.cancel()
+        if self._task is not None and not self._done.is_set():
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def result(self):
+        """The coroutine's result; re-raises its exception."""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,79 @@
+"""
+One document, many generation configurations.
+
+The same upload is often generated at every tone and for several subject
+audiences. The text is extracted once and PreparedDocument preprocesses it once
+(passages and BM25 index, then one passage selection per subject), and
+agenerate_configurations runs all (number, subject, tone) configurations
+concurrently, so the wall time is close to that of the slowest configuration.
+"""
+
+import asyncio
+import itertools
+
+from src.mcq_generator.MCQgenerator import agenerate_evaluate
+from src.mcq_generator.retrieval import PreparedDocument
+from src.mcq_generator.deadline import Deadline
+from src.mcq_generator.profiling import span
+
+TONES = ("Simple", "Moderate", "Complex")
+
+
+def configuration_matrix(numbers, subjects, tones=TONES):
+    """
+    All (number, subject, tone) combinations, without duplicates.
+
+    Returns:
+    - list[tuple]: Configurations in a stable order.
+    """
+    return list(dict.fromkeys(itertools.product(numbers, subjects, tones)))
+
+
+async def agenerate_configurations(document, configurations, response_json, deadline=None,
+                                   hedge=False, max_concurrency=None):
+    """
+    Generate one quiz per configuration from a single document.
+
+    Parameters:
+    - document (PreparedDocument | str | dict): The document, its extracted text, or
+      subject -> text selected elsewhere (e.g. by an extraction worker, see isolation.py).
+    - configurations (iterable[tuple]): (number, subject, tone) configurations.
+    - response_json (str): The response schema, as for generate_evaluate_chain.
+    - deadline (Deadline, optional): Shared time budget and cancellation.
+    - hedge (bool): Hedge the quiz generation stage of each configuration.
+    - max_concurrency (int, optional): Maximum configurations in flight; all by default.
+
+    Returns:
+    - dict: Configuration -> agenerate_evaluate result, or the exception it raised,
+      in the order the configurations were given.
+    """
+    if isinstance(document, str):
+        document = PreparedDocument(document)
+    deadline = deadline or Deadline()
+    configurations = list(dict.fromkeys(tuple(c) for c in configurations))
+    semaphore = asyncio.Semaphore(max_concurrency or max(1, len(configurations)))
+
+    with span("passage selection"):
+        texts = {
+            subject: document[subject] if isinstance(document, dict) else document.text_for(subject)
+            for _, subject, _ in configurations
+        }
+
+    async def generate(number, subject, tone):
+        async with semaphore:
+            return await agenerate_evaluate({
+                "text": texts[subject],
+                "number": number,
+                "subject": subject,
+                "tone": tone,
+                "response_json": response_json
+            }, deadline, hedge=hedge)
+
+    results = await asyncio.gather(*(generate(*c) for c in configurations), return_exceptions=True)
+    return dict(zip(configurations, results))
+
+
+def generate_configurations(document, configurations, response_json, timeout=None, **options):
+    """Synchronous wrapper around agenerate_configurations; timeout is an end-to-end deadline in seconds."""
+    return asyncio.run(agenerate_configurations(document, configurations, response_json,
+                                                deadline=Deadline(timeout), **options))
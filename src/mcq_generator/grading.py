@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Bulk grading and item analysis for answer sheets.
+
+Answer sheets are read in chunks from CSV (one row per submission, a
+`student_id` column, an optional `variant` column and one column per question
+id such as `1`, `q1` or `question_1`) or JSONL (one object per line:
+{"student_id": ..., "variant": ..., "answers": {"1": "A", ...}}).
+Every chunk is encoded into an int8 matrix in the question space of the
+original quiz and scored with NumPy, so grading cost is a handful of array
+operations per chunk rather than a Python loop per answer.
+"""
+
+import re
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# Codes used in the encoded answer matrix
+NOT_PRESENTED = -2   # question was not part of the submission's variant
+BLANK = -1           # question presented but unanswered (or answered with an unknown letter)
+
+_QUESTION_COLUMN_RE = re.compile(r"^(?:q|question)?[_ ]?(\d+)$", re.IGNORECASE)
+
+# Columns of an answer sheet that are not answers
+_SHEET_COLUMNS = {"student_id", "variant"}
+
+
+def _question_key(value):
+    """Normalise a question id or answer column name: 1, "1", "q1" and "question_01" all give "1"."""
+    value = str(value).strip()
+    match = _QUESTION_COLUMN_RE.match(value)
+    return str(int(match.group(1))) if match else value
+
+
+class AnswerKey:
+    """
+    Correct answers of a quiz, plus the mapping from each variant back to the original quiz.
+
+    Parameters:
+    - quiz (dict): The original quiz (the question pool) in the Response.json shape.
+    - variants (list[dict], optional): Variants produced by variants.generate_variants.
+    """
+
+    def __init__(self, quiz, variants=None):
+        questions = quiz["questions"]
+        self.question_ids = [q["id"] for q in questions]
+        self.letters = sorted({letter for q in questions for letter in q["options"]})
+        self._col = {_question_key(qid): i for i, qid in enumerate(self.question_ids)}
+        self._letter_code = {letter: i for i, letter in enumerate(self.letters)}
+        self.key = np.array([self._letter_code[q["correct_answer"]] for q in questions], dtype=np.int8)
+
+        self.variants = {}
+        for variant in variants or []:
+            self.variants[str(variant["quiz_info"]["variant"])] = self._variant_map(questions, variant)
+        self._known = set(self._col).union(*self.variants.values())
+
+    def _variant_map(self, questions, variant):
+        """
+        For each variant question id: (source column, letter remap), where the remap
+        converts a variant letter code into the letter code of the same option text
+        in the original question. The remap has a trailing BLANK so that indexing it
+        with BLANK (-1) keeps blanks blank.
+        """
+        mapping = {}
+        for vq in variant["questions"]:
+            col = self._col[_question_key(vq["source_id"])]
+            source_options = questions[col]["options"]
+            by_text = {text: letter for letter, text in source_options.items()}
+            remap = np.full(len(self.letters) + 1, BLANK, dtype=np.int8)
+            for letter, text in vq["options"].items():
+                remap[self._letter_code[letter]] = self._letter_code[by_text[text]]
+            mapping[_question_key(vq["id"])] = (col, remap)
+        return mapping
+
+    def encode_letters(self, values):
+        """Vectorised letter -> code conversion for a 2-D array of answer strings."""
+        values = np.char.upper(np.char.strip(values.astype(str)))
+        codes = np.full(values.shape, BLANK, dtype=np.int8)
+        for letter, code in self._letter_code.items():
+            codes[values == letter] = code
+        return codes
+
+    def encode(self, chunk):
+        """
+        Encode a chunk of answer sheets into the original quiz's question space.
+
+        Answer columns are matched to question ids as strings, so 1, "1" and "q1" agree.
+
+        Returns:
+        - numpy.ndarray: int8 matrix (submissions x questions) of letter codes,
+          BLANK or NOT_PRESENTED.
+
+        Raises:
+        - Exception: If the chunk has answer columns but none of them is a question of the quiz.
+        """
+        columns = {}
+        for name in chunk.columns:
+            key = _question_key(name)
+            if key in self._known:
+                columns[name] = key
+        others = [str(name) for name in chunk.columns if name not in columns and str(name) not in _SHEET_COLUMNS]
+        if not columns and others:
+            expected = ", ".join(sorted(self._col, key=lambda k: (len(k), k))[:5])
+            raise Exception(f"no answer column matches the quiz's question ids (expected e.g. {expected}; "
+                            f"got {', '.join(others[:5])})")
+        names = list(columns)
+        raw = self.encode_letters(chunk[names].fillna("").to_numpy()) if names else np.empty((len(chunk), 0), np.int8)
+
+        out = np.full((len(chunk), len(self.question_ids)), BLANK, dtype=np.int8)
+        variant_col = chunk["variant"].fillna("").astype(str).str.strip() if "variant" in chunk else None
+
+        if variant_col is None or not self.variants:
+            for c, qid in enumerate(columns.values()):
+                if qid in self._col:
+                    out[:, self._col[qid]] = raw[:, c]
+            return out
+
+        for variant in variant_col.unique():
+            rows = (variant_col == variant).to_numpy()
+            if variant == "":
+                # No variant recorded: answers refer to the original quiz
+                for c, qid in enumerate(columns.values()):
+                    if qid in self._col:
+                        out[rows, self._col[qid]] = raw[rows, c]
+                continue
+            if variant.endswith(".0"):
+                variant = variant[:-2]
+            if variant not in self.variants:
+                raise Exception(f"answer sheet refers to unknown variant {variant!r}")
+
+            mapping = self.variants[variant]
+            block = np.full((rows.sum(), len(self.question_ids)), NOT_PRESENTED, dtype=np.int8)
+            for col, _ in mapping.values():
+                block[:, col] = BLANK
+            for c, qid in enumerate(columns.values()):
+                if qid in mapping:
+                    col, remap = mapping[qid]
+                    block[:, col] = remap[raw[rows, c]]
+            out[rows] = block
+        return out
+
+
+class ItemStatistics:
+    """
+    Streaming accumulator for item analysis.
+
+    Keeps per-question sums only, so the statistics over any number of submissions
+    cost O(questions x options) memory.
+    """
+
+    def __init__(self, answer_key):
+        self.answer_key = answer_key
+        n_items, n_letters = len(answer_key.question_ids), len(answer_key.letters)
+        self.n = np.zeros(n_items, dtype=np.int64)
+        self.sum_x = np.zeros(n_items, dtype=np.int64)
+        self.sum_y = np.zeros(n_items, dtype=np.float64)
+        self.sum_yy = np.zeros(n_items, dtype=np.float64)
+        self.sum_xy = np.zeros(n_items, dtype=np.float64)
+        # Column 0 counts blanks, column k + 1 counts letter k
+        self.choices = np.zeros((n_items, n_letters + 1), dtype=np.int64)
+
+    def update(self, codes, correct, scores):
+        presented = codes != NOT_PRESENTED
+        y = scores.astype(np.float64)[:, None]
+        self.n += presented.sum(axis=0)
+        self.sum_x += correct.sum(axis=0)
+        self.sum_y += (presented * y).sum(axis=0)
+        self.sum_yy += (presented * y * y).sum(axis=0)
+        self.sum_xy += (correct * y).sum(axis=0)
+
+        n_items, width = self.choices.shape
+        flat = (np.nonzero(presented)[1] * width + codes[presented].astype(np.int64) + 1)
+        self.choices += np.bincount(flat, minlength=n_items * width).reshape(n_items, width)
+
+    def to_frame(self):
+        """
+        Item statistics as a DataFrame.
+
+        - difficulty: proportion of examinees answering correctly (p-value).
+        - discrimination: corrected point-biserial correlation between the item and
+          the total score with that item removed.
+        - blank / option columns: how often each option (distractor) was chosen.
+        """
+        n = self.n.astype(np.float64)
+        sx = self.sum_x.astype(np.float64)
+        # Remove the item from the total score: y' = y - x (and x * x == x)
+        sy = self.sum_y - sx
+        sxy = self.sum_xy - sx
+        syy = self.sum_yy - 2 * self.sum_xy + sx
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            difficulty = np.where(n > 0, sx / n, np.nan)
+            numerator = n * sxy - sx * sy
+            denominator = np.sqrt((n * sx - sx * sx) * (n * syy - sy * sy))
+            discrimination = np.where(denominator > 0, numerator / denominator, np.nan)
+
+        key = self.answer_key
+        frame = pd.DataFrame({
+            "question_id": key.question_ids,
+            "correct_answer": [key.letters[k] for k in key.key],
+            "n": self.n,
+            "difficulty": np.round(difficulty, 4),
+            "discrimination": np.round(discrimination, 4),
+            "blank": self.choices[:, 0],
+        })
+        for i, letter in enumerate(key.letters):
+            frame[f"chose_{letter}"] = self.choices[:, i + 1]
+        return frame
+
+
+def iter_answer_sheets(path, chunk_size=50000):
+    """
+    Read answer sheets in chunks of DataFrames.
+
+    Parameters:
+    - path (str): A .csv or .jsonl file.
+    - chunk_size (int): Submissions per chunk.
+    """
+    if str(path).lower().endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            records = []
+            for line in f:
+                if not line.strip():
+                    continue
+                sheet = json.loads(line)
+                record = {key: value for key, value in sheet.items() if key != "answers"}
+                record.update({str(qid): answer for qid, answer in (sheet.get("answers") or {}).items()})
+                records.append(record)
+                if len(records) >= chunk_size:
+                    yield pd.DataFrame.from_records(records)
+                    records = []
+            if records:
+                yield pd.DataFrame.from_records(records)
+    else:
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+
+
+def grade_chunk(answer_key, chunk):
+    """
+    Score one chunk of answer sheets.
+
+    Returns:
+    - tuple: (codes, correct, scores, totals) as NumPy arrays.
+    """
+    codes = answer_key.encode(chunk)
+    correct = codes == answer_key.key[None, :]
+    scores = correct.sum(axis=1)
+    totals = (codes != NOT_PRESENTED).sum(axis=1)
+    return codes, correct, scores, totals
+
+
+def grade_file(answers_path, quiz, variants=None, results_file=None, item_stats_file=None, chunk_size=50000):
+    """
+    Grade every submission in an answer sheet file and compute item statistics.
+
+    Parameters:
+    - answers_path (str): CSV or JSONL answer sheets.
+    - quiz (dict | str): The original quiz in the Response.json shape (or its JSON string).
+    - variants (list[dict], optional): Variants the submissions were taken from.
+    - results_file (str, optional): CSV receiving one row per submission, written chunk by chunk.
+    - item_stats_file (str, optional): CSV receiving the item analysis.
+    - chunk_size (int): Submissions processed per chunk.
+
+    Returns:
+    - tuple: (summary dict, item statistics DataFrame).
+    """
+    if isinstance(quiz, str):
+        quiz = json.loads(quiz)
+    answer_key = AnswerKey(quiz, variants)
+    stats = ItemStatistics(answer_key)
+
+    n_submissions = 0
+    score_sum = 0.0
+    percent_sum = 0.0
+    first = True
+    for chunk in iter_answer_sheets(answers_path, chunk_size):
+        codes, correct, scores, totals = grade_chunk(answer_key, chunk)
+        stats.update(codes, correct, scores)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percent = np.where(totals > 0, 100.0 * scores / totals, 0.0)
+        n_submissions += len(chunk)
+        score_sum += float(scores.sum())
+        percent_sum += float(percent.sum())
+
+        if results_file:
+            results = pd.DataFrame({
+                "student_id": chunk["student_id"] if "student_id" in chunk else np.arange(n_submissions - len(chunk), n_submissions),
+                "score": scores,
+                "total": totals,
+                "percent": np.round(percent, 2),
+            })
+            if "variant" in chunk:
+                results.insert(1, "variant", chunk["variant"].to_numpy())
+            results.to_csv(results_file, mode="w" if first else "a", header=first, index=False, encoding="utf-8")
+        first = False
+
+    item_stats = stats.to_frame()
+    if item_stats_file:
+        item_stats.to_csv(item_stats_file, index=False, encoding="utf-8")
+
+    summary = {
+        "submissions": n_submissions,
+        "mean_score": score_sum / n_submissions if n_submissions else 0.0,
+        "mean_percent": percent_sum / n_submissions if n_submissions else 0.0,
+    }
+    return summary, item_stats
+
+
+def _load_variants(path):
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    return payload["variants"] if isinstance(payload, dict) else payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade answer sheets and compute item statistics")
+    parser.add_argument("quiz", help="Quiz JSON file (the original question pool)")
+    parser.add_argument("answers", help="Answer sheets (.csv or .jsonl)")
+    parser.add_argument("--variants", help="Variants JSON written by the CLI --variants option")
+    parser.add_argument("--results", default="results.csv", help="Per-submission results CSV (default: results.csv)")
+    parser.add_argument("--item-stats", default="item_stats.csv", help="Item analysis CSV (default: item_stats.csv)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Submissions per chunk (default: 50000)")
+    args = parser.parse_args()
+
+    try:
+        with open(args.quiz, "r", encoding="utf-8") as f:
+            quiz = json.load(f)
+        variants = _load_variants(args.variants) if args.variants else None
+        summary, _ = grade_file(args.answers, quiz, variants, args.results, args.item_stats, args.chunk_size)
+    except Exception as e:
+        print(f"Error grading answer sheets: {e}")
+        sys.exit(1)
+
+    print(f"✅ Graded {summary['submissions']} submissions (mean {summary['mean_percent']:.1f}%)")
+    print(f"✅ Results saved to: {args.results}")
+    print(f"✅ Item statistics saved to: {args.item_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Hedged (speculative) LLM requests to cut tail latency.
+
+If the primary request has not finished after a percentile of recently observed
+latencies (or returns output that fails local validation), a second request is
+launched, optionally with different sampling parameters. The first result that
+passes validation wins and the other request is cancelled. Extra requests are
+capped by a budget relative to the number of primary requests.
+"""
+
+import json
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+
+from src.mcq_generator.variants import validate_quiz
+
+
+def parse_quiz_output(text):
+    """
+    Parse the JSON object in a raw quiz completion, tolerating surrounding prose or code fences.
+
+    Returns:
+    - dict | None: The parsed quiz, or None if no valid JSON object is found.
+    """
+    if not text:
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+def is_valid_quiz_output(text, number=None):
+    """Local validation of a quiz completion: parsable, well-formed and with the requested question count."""
+    quiz = parse_quiz_output(text)
+    if quiz is None:
+        return False
+    try:
+        validate_quiz(quiz)
+    except Exception:
+        return False
+    return number is None or len(quiz["questions"]) == int(number)
+
+
+class LatencyTracker:
+    """Sliding window of recent request latencies."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = list(self._samples)
+        return float(np.percentile(samples, q)) if samples else None
+
+    def mean_above(self, seconds):
+        """Mean of the recent latencies of at least this many seconds, or None if there are none."""
+        with self._lock:
+            tail = [s for s in self._samples if s >= seconds]
+        return sum(tail) / len(tail) if tail else None
+
+
+class HedgePolicy:
+    """
+    When and how to launch a hedge request.
+
+    Parameters:
+    - percentile (float): Hedge once the primary has run longer than this percentile of recent latencies.
+    - min_samples (int): Latencies needed before the percentile is trusted; default_delay is used until then.
+    - default_delay (float): Hedge delay in seconds while there is not enough latency history.
+    - budget (float): Maximum extra requests as a fraction of primary requests (0.1 = at most 10% more calls).
+    - burst (int): Extra requests allowed before the budget ratio applies.
+    - hedge_params (dict): Overrides for the hedge request, e.g. {"temperature": 0.7, "seed": 1234}.
+    """
+
+    def __init__(self, percentile=95, min_samples=10, default_delay=15.0, budget=0.1, burst=2,
+                 hedge_params=None, window=200):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.budget = budget
+        self.burst = burst
+        self.hedge_params = hedge_params or {}
+        self.latencies = LatencyTracker(window)
+        self.metrics = HedgeMetrics()
+
+    def hedge_delay(self):
+        if len(self.latencies) < self.min_samples:
+            return self.default_delay
+        return self.latencies.percentile(self.percentile)
+
+    def try_acquire_hedge(self):
+        """Reserve one extra request if the budget allows it."""
+        return self.metrics.try_acquire(self.budget, self.burst)
+
+
+class HedgeMetrics:
+    """Counters for hedge rate, outcomes and estimated latency saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.invalid_primaries = 0
+        self.cancelled = 0
+        self.latency_saved = 0.0
+
+    def try_acquire(self, budget, burst):
+        with self._lock:
+            if self.hedges < burst + budget * self.requests:
+                self.hedges += 1
+                return True
+            return False
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "invalid_primaries": self.invalid_primaries,
+                "cancelled": self.cancelled,
+                "latency_saved_s": round(self.latency_saved, 3),
+            }
+
+
+async def hedged_call(call, validate, policy):
+    """
+    Run an async call with hedging.
+
+    Parameters:
+    - call (callable): call(params) -> awaitable result; params is {} for the primary
+      and policy.hedge_params for the hedge.
+    - validate (callable): validate(result) -> bool, the local acceptance check.
+    - policy (HedgePolicy): Delay, budget and metrics.
+
+    Returns:
+    - The first valid result. If no result is valid, the first completed result is
+      returned so behaviour is never worse than an unhedged call.
+    """
+    policy.metrics.add(requests=1)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    delay = policy.hedge_delay()
+
+    tasks = {asyncio.ensure_future(call({})): ("primary", started)}
+    hedged = False
+    fallback = None
+    error = None
+    primary_done_at = None
+
+    def launch_hedge():
+        nonlocal hedged
+        hedged = True
+        if policy.try_acquire_hedge():
+            tasks[asyncio.ensure_future(call(dict(policy.hedge_params)))] = ("hedge", loop.time())
+
+    try:
+        while tasks:
+            timeout = None if hedged else max(0.0, started + delay - loop.time())
+            done, _ = await asyncio.wait(list(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch_hedge()
+                continue
+
+            for task in done:
+                role, launched = tasks.pop(task)
+                now = loop.time()
+                if role == "primary":
+                    primary_done_at = now - started
+                try:
+                    result = task.result()
+                except Exception as e:
+                    error = error or e
+                    result, valid = None, False
+                else:
+                    policy.latencies.observe(now - launched)
+                    valid = validate(result)
+                    if not valid and fallback is None:
+                        fallback = result
+
+                if valid:
+                    if role == "hedge":
+                        policy.metrics.add(hedge_wins=1, latency_saved=_estimate_saved(policy, primary_done_at, now - started))
+                    return result
+
+                if role == "primary":
+                    policy.metrics.add(invalid_primaries=1)
+                    if not hedged:
+                        launch_hedge()
+    finally:
+        losers = list(tasks)
+        for task in losers:
+            task.cancel()
+            role, launched = tasks[task]
+            if role == "primary":
+                # The primary ran at least this long; without the sample the percentile
+                # would only see fast requests and the hedge delay would drift down
+                policy.latencies.observe(loop.time() - launched)
+        if losers:
+            policy.metrics.add(cancelled=len(losers))
+            await asyncio.gather(*losers, return_exceptions=True)
+
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+def _estimate_saved(policy, primary_done_at, elapsed):
+    """
+    Estimated seconds a winning hedge saved over waiting for the primary.
+
+    An invalid primary is compared with a manual retry started when it came back.
+    A primary still running is assumed to take the mean of recent latencies at
+    least as long as it has already run, or one more median request if it already
+    outlasted all of them.
+    """
+    median = policy.latencies.percentile(50) or 0.0
+    if primary_done_at is not None:
+        return max(0.0, primary_done_at + median - elapsed)
+    tail = policy.latencies.mean_above(elapsed)
+    return max(0.0, (tail if tail is not None else elapsed + median) - elapsed)
+
+
+# Process-wide policy so that latency history and metrics accumulate across requests
+DEFAULT_HEDGE_POLICY = HedgePolicy()
@@ -0,0 +1,255 @@
+"""
+Incremental regeneration of a document's quiz after revisions.
+
+The extracted text is cut into sections whose boundaries depend only on nearby
+content (headings, or paragraphs whose hash selects them as cut points once a
+section is large enough), so an edit moves at most the boundaries around it.
+Each section is identified by the hash of its normalised text, and generated
+questions are attributed to the section they came from. A manifest per document
+maps section hashes to their questions; re-submitting a revised document only
+sends new or changed sections to the LLM and reuses the questions of the rest.
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+from datetime import datetime
+
+from src.mcq_generator.MCQgenerator import agenerate_evaluate
+from src.mcq_generator.retrieval import estimate_tokens, split_passages
+from src.mcq_generator.hedging import parse_quiz_output
+from src.mcq_generator.variants import validate_quiz
+from src.mcq_generator.deadline import Deadline
+from src.mcq_generator.profiling import span
+
+DEFAULT_STORE_DIR = ".mcq_sections"
+
+# Sections are cut at a heading or content-selected paragraph once they reach the
+# minimum size, and always before exceeding the maximum (well under the prompt budget)
+SECTION_MIN_TOKENS = 800
+SECTION_MAX_TOKENS = 3000
+# About one in BOUNDARY_MODULUS paragraphs is a cut point
+BOUNDARY_MODULUS = 4
+
+# Questions generated per this many section tokens, at least one and at most 20 per section
+TOKENS_PER_QUESTION = 400
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Keyword headings in any case; numbered headings only when followed by a capital ("3 apples" is not one)
+_HEADING_RE = re.compile(r"^(#{1,6}\s|(?i:chapter|section|part|unit|lesson)\b|\d+(\.\d+)*\.?\s+[A-Z])")
+
+
+def section_hash(text):
+    """Hash of a section's text, insensitive to whitespace and line-wrapping changes."""
+    normalized = _WHITESPACE_RE.sub(" ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def _is_heading(passage):
+    return "\n" not in passage and len(passage) <= 120 and bool(_HEADING_RE.match(passage))
+
+
+def _is_cut_point(passage):
+    return int(section_hash(passage), 16) % BOUNDARY_MODULUS == 0
+
+
+def split_sections(text, min_tokens=SECTION_MIN_TOKENS, max_tokens=SECTION_MAX_TOKENS):
+    """
+    Split extracted text into content-defined sections.
+
+    Parameters:
+    - text (str): The document text, e.g. from read_file.
+    - min_tokens (int): Sections are not cut before reaching this size.
+    - max_tokens (int): Sections are always cut before exceeding this size.
+
+    Returns:
+    - list[dict]: Sections in document order with 'hash', 'text' and 'tokens'.
+    """
+    sections = []
+    current, current_tokens = [], 0
+
+    def close():
+        body = "\n\n".join(current)
+        sections.append({"hash": section_hash(body), "text": body, "tokens": current_tokens})
+
+    for passage in split_passages(text):
+        tokens = estimate_tokens(passage)
+        if current and (current_tokens + tokens > max_tokens or
+                        (current_tokens >= min_tokens and _is_heading(passage))):
+            close()
+            current, current_tokens = [], 0
+        current.append(passage)
+        current_tokens += tokens
+        if current_tokens >= min_tokens and _is_cut_point(passage) and not _is_heading(passage):
+            close()
+            current, current_tokens = [], 0
+    if current:
+        close()
+    return sections
+
+
+def questions_for_section(tokens, tokens_per_question=TOKENS_PER_QUESTION):
+    return max(1, min(20, round(tokens / tokens_per_question)))
+
+
+def _config_key(subject, tone, response_json, tokens_per_question):
+    payload = json.dumps([subject, tone, response_json, tokens_per_question], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _manifest_path(store_dir, document_id):
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", document_id).strip("._") or "document"
+    return os.path.join(store_dir, f"{safe_id}.json")
+
+
+def load_manifest(document_id, store_dir=DEFAULT_STORE_DIR):
+    """The stored manifest of a document, or None if it was never generated."""
+    path = _manifest_path(store_dir, document_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, store_dir=DEFAULT_STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    path = _manifest_path(store_dir, manifest["document"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def assemble_quiz(manifest):
+    """
+    Build the document's quiz from its manifest.
+
+    Questions are renumbered in document order and keep a 'section' field with the
+    hash of the section they were generated from. A section whose text repeats in
+    the document contributes its questions once.
+    """
+    questions = []
+    seen = set()
+    for section in manifest["sections"]:
+        if section["hash"] in seen:
+            continue
+        seen.add(section["hash"])
+        for q in section["questions"]:
+            questions.append({**q, "id": len(questions) + 1, "section": section["hash"]})
+    quiz_info = {
+        "title": manifest["document"],
+        "subject": manifest["subject"],
+        "difficulty": manifest["tone"],
+        "total_questions": len(questions),
+    }
+    return {"quiz_info": quiz_info, "questions": questions}
+
+
+async def _generate_section(section, inputs, semaphore, deadline, hedge, policy):
+    async with semaphore:
+        result = await agenerate_evaluate(
+            {**inputs, "text": section["text"], "number": section["number"]}, deadline, hedge, policy
+        )
+    quiz = parse_quiz_output(result["fixed_quiz"])
+    validate_quiz(quiz)
+    return quiz["questions"], result.get("review", "")
+
+
+async def aregenerate(text, document_id, subject, tone, response_json, store_dir=DEFAULT_STORE_DIR,
+                      tokens_per_question=TOKENS_PER_QUESTION, max_concurrency=4, deadline=None,
+                      hedge=False, policy=None):
+    """
+    Generate a document's quiz, regenerating only sections that changed since the last run.
+
+    Sections whose hash is in the stored manifest (for the same subject, tone,
+    schema and question density) keep their questions, even if they moved; new or
+    edited sections are generated concurrently. The manifest is updated only for
+    sections that succeeded, so a failed or cancelled run can simply be resubmitted.
+
+    Parameters:
+    - text (str): The document text, e.g. from read_file.
+    - document_id (str): Stable name of the document, e.g. its file name.
+    - subject, tone, response_json: As for generate_evaluate_chain.
+    - store_dir (str): Directory holding the per-document manifests.
+    - tokens_per_question (int): Section tokens per generated question.
+    - max_concurrency (int): Maximum sections generated at once.
+    - deadline (Deadline, optional): Time budget and cancellation for the whole run.
+    - hedge (bool): Hedge the quiz generation of each section.
+    - policy (HedgePolicy, optional): Defaults to the process-wide DEFAULT_HEDGE_POLICY.
+
+    Returns:
+    - tuple: (quiz dict, stats dict with 'sections', 'reused', 'generated', 'failed' and 'removed').
+    """
+    deadline = deadline or Deadline()
+    with span("sectioning"):
+        sections = split_sections(text)
+    config = _config_key(subject, tone, response_json, tokens_per_question)
+
+    previous = load_manifest(document_id, store_dir)
+    known = {}
+    if previous and previous.get("config") == config:
+        known = {s["hash"]: s for s in previous["sections"]}
+
+    inputs = {"subject": subject, "tone": tone, "response_json": response_json}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    entries, jobs, seen = [], {}, set()
+    for section in sections:
+        # Sections with identical text share a hash and are generated and kept once
+        if section["hash"] in seen:
+            continue
+        seen.add(section["hash"])
+        if section["hash"] in known:
+            entries.append(known[section["hash"]])
+            continue
+        section["number"] = questions_for_section(section["tokens"], tokens_per_question)
+        entry = {"hash": section["hash"], "tokens": section["tokens"], "questions": [], "review": ""}
+        entries.append(entry)
+        jobs[section["hash"]] = asyncio.ensure_future(_generate_section(section, inputs, semaphore, deadline, hedge, policy))
+
+    try:
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+    except BaseException:
+        for job in jobs.values():
+            job.cancel()
+        raise
+
+    generated = dict(zip(jobs, results))
+    failed = 0
+    for entry in entries:
+        result = generated.get(entry["hash"])
+        if isinstance(result, BaseException):
+            failed += 1
+        elif result is not None:
+            entry["questions"], entry["review"] = result
+
+    manifest = {
+        "document": document_id,
+        "subject": subject,
+        "tone": tone,
+        "config": config,
+        "updated": datetime.now().isoformat(timespec="seconds"),
+        # Failed sections are left out so the next run retries them
+        "sections": [e for e in entries if e["questions"]],
+    }
+    save_manifest(manifest, store_dir)
+
+    current = {s["hash"] for s in sections}
+    stats = {
+        "sections": len(sections),
+        "reused": sum(1 for s in sections if s["hash"] in known),
+        "generated": len(jobs) - sum(isinstance(r, BaseException) for r in results),
+        "failed": failed,
+        "removed": len(set(known) - current),
+    }
+    if failed and not manifest["sections"]:
+        raise next(r for r in results if isinstance(r, BaseException))
+    return assemble_quiz(manifest), stats
+
+
+def regenerate(text, document_id, subject, tone, response_json, timeout=None, **options):
+    """Synchronous wrapper around aregenerate; timeout is an end-to-end deadline in seconds."""
+    return asyncio.run(aregenerate(text, document_id, subject, tone, response_json,
+                                   deadline=Deadline(timeout), **options))
@@ -0,0 +1,401 @@
+import os
+import re
+import io
+import mmap
+import codecs
+import zipfile
+import posixpath
+import mimetypes
+from html.parser import HTMLParser
+from urllib.parse import unquote
+import xml.etree.ElementTree as ET
+
+# Extractors yield text in chunks of roughly this many characters
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Bytes inspected to guess the encoding of plain text files
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# A cp1252 reading is trusted while at most this share of its letters are non-ASCII
+WESTERN_ACCENTED_SHARE = 0.3
+
+# Registry of extractors keyed by lowercase file extension (".txt") or MIME type ("text/plain")
+EXTRACTORS = {}
+
+
+def register_extractor(*keys):
+    """
+    Register an extractor for the given extensions and/or MIME types.
+
+    An extractor is a callable (source, chunk_size) -> iterator of str, where
+    source is a path or a binary file-like object (e.g. a Streamlit upload).
+    """
+    def decorator(func):
+        for key in keys:
+            EXTRACTORS[key.lower()] = func
+        return func
+    return decorator
+
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, "name", "") or ""
+
+
+def get_extractor(source):
+    """
+    Find the extractor for a path or uploaded file, by extension first and then by MIME type.
+    """
+    name = _source_name(source).lower()
+    extension = os.path.splitext(name)[1]
+    if extension in EXTRACTORS:
+        return EXTRACTORS[extension]
+
+    mime_type = getattr(source, "type", None) or mimetypes.guess_type(name)[0]
+    if mime_type and mime_type.lower() in EXTRACTORS:
+        return EXTRACTORS[mime_type.lower()]
+
+    supported = ", ".join(sorted(k for k in EXTRACTORS if k.startswith(".")))
+    raise Exception(f"unsupported file format, supported formats: {supported}")
+
+
+def iter_text(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream the text of a document in chunks.
+
+    Parameters:
+    - source (str | PathLike | file-like): Path or binary file object with a .name.
+    - chunk_size (int): Approximate number of characters per chunk.
+
+    Returns:
+    - iterator[str]: Text chunks in document order.
+    """
+    return get_extractor(source)(source, chunk_size)
+
+
+# --------------------------------------------------------------------------
+# Byte streaming and encoding detection
+# --------------------------------------------------------------------------
+
+def _iter_bytes(source, chunk_size):
+    """Yield raw bytes from a path (through mmap) or a file-like object."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in range(0, len(mm), chunk_size):
+                    yield mm[start:start + chunk_size]
+        return
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    while True:
+        block = source.read(chunk_size)
+        if not block:
+            break
+        yield block
+
+
+def detect_encoding(sample):
+    """
+    Guess the encoding of a byte sample.
+
+    BOMs win, then strict UTF-8, then cp1252 when the sample decodes strictly and
+    reads as Western text (mostly ASCII letters with sparse accents), then
+    charset-normalizer or chardet when one is installed, and finally cp1252.
+    Detectors often mistake short cp1252 text for cp1250/cp1257, so they are only
+    consulted for text that cp1252 cannot explain.
+    """
+    for bom, encoding in (
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    ):
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # Non-final decode so a multi-byte character cut at the end of the sample is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if _looks_like_cp1252(sample):
+        return "cp1252"
+
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        try:
+            import chardet
+            guess = chardet.detect(sample)
+            if guess.get("encoding"):
+                return guess["encoding"]
+        except ImportError:
+            pass
+
+    return "cp1252"
+
+
+def _looks_like_cp1252(sample):
+    try:
+        text = sample.decode("cp1252")
+    except UnicodeDecodeError:
+        return False
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return True
+    # Cyrillic, Greek etc. read as cp1252 come out as runs of accented Latin letters
+    accented = sum(1 for c in letters if ord(c) > 127)
+    return accented <= WESTERN_ACCENTED_SHARE * len(letters)
+
+
+def _iter_decoded(blocks, encoding=None):
+    """Decode an iterator of byte blocks incrementally, detecting the encoding from the first block."""
+    decoder = None
+    for block in blocks:
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(encoding or detect_encoding(block[:ENCODING_SAMPLE_SIZE]))(errors="replace")
+        text = decoder.decode(block)
+        if text:
+            yield text
+    if decoder is not None:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _iter_lines(chunks):
+    """Re-cut text chunks on line boundaries so line-based processing never sees half a line."""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        cut = pending.rfind("\n")
+        if cut == -1:
+            continue
+        yield pending[:cut + 1]
+        pending = pending[cut + 1:]
+    if pending:
+        yield pending
+
+
+# --------------------------------------------------------------------------
+# Extractors
+# --------------------------------------------------------------------------
+
+@register_extractor(".txt", ".text", "text/plain")
+def extract_text(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Plain text with encoding detection, read incrementally."""
+    return _iter_decoded(_iter_bytes(source, max(chunk_size, ENCODING_SAMPLE_SIZE)))
+
+
+@register_extractor(".pdf", "application/pdf")
+def extract_pdf(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """PDF text, one page at a time."""
+    import PyPDF2
+
+    try:
+        reader_cls = getattr(PyPDF2, "PdfReader", None) or PyPDF2.PdfFileReader
+        pdf_reader = reader_cls(source)
+        pages = pdf_reader.pages
+    except Exception:
+        raise Exception("error reading the PDF file")
+
+    for page in pages:
+        try:
+            text = page.extract_text()
+        except Exception:
+            raise Exception("error reading the PDF file")
+        if text:
+            yield text
+
+
+_MD_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_MD_RULES = [
+    (re.compile(r"^\s{0,3}\[[^\]]+\]:\s+\S+.*$"), ""),      # reference link definitions
+    (re.compile(r"^\s{0,3}([-*_]\s*){3,}$"), ""),            # horizontal rules
+    (re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$"), r"\1"),  # ATX headings
+    (re.compile(r"^\s{0,3}>\s?"), ""),                        # block quotes
+    (re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+"), ""),            # list markers
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),           # images
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),            # inline links
+    (re.compile(r"<[^>\n]+>"), ""),                           # inline HTML
+    (re.compile(r"(\*\*|__|`)"), ""),                         # bold, code spans
+    (re.compile(r"(?<!\w)[*_](?=\S)|(?<=\S)[*_](?!\w)"), ""),  # italics
+]
+
+
+@register_extractor(".md", ".markdown", "text/markdown", "text/x-markdown")
+def extract_markdown(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Markdown with formatting syntax stripped, processed line by line."""
+    in_fence = False
+    for block in _iter_lines(extract_text(source, chunk_size)):
+        out = []
+        for line in block.splitlines(True):
+            if _MD_FENCE_RE.match(line):
+                in_fence = not in_fence
+                continue
+            if not in_fence:
+                newline = "\n" if line.endswith("\n") else ""
+                line = line.rstrip("\n")
+                for pattern, repl in _MD_RULES:
+                    line = pattern.sub(repl, line)
+                line += newline
+            out.append(line)
+        yield "".join(out)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Incremental HTML -> text converter; call drain() to collect the text seen so far."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "template", "head"}
+    BLOCK_TAGS = {
+        "p", "div", "section", "article", "header", "footer", "aside", "nav", "main",
+        "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table", "tr", "blockquote",
+        "pre", "figure", "figcaption", "dl", "dt", "dd", "title",
+    }
+    LINE_TAGS = {"br", "li", "td", "th", "hr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._parts.append("\n\n")
+        elif tag in self.LINE_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self._parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(re.sub(r"\s+", " ", data))
+
+    def drain(self):
+        text = re.sub(r" *\n[\n ]*\n *", "\n\n", "".join(self._parts))
+        self._parts = []
+        return text
+
+
+def _iter_html(text_chunks):
+    parser = _HTMLTextExtractor()
+    for chunk in text_chunks:
+        parser.feed(chunk)
+        text = parser.drain()
+        if text.strip():
+            yield text
+    parser.close()
+    text = parser.drain()
+    if text.strip():
+        yield text
+
+
+@register_extractor(".html", ".htm", ".xhtml", "text/html", "application/xhtml+xml")
+def extract_html(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Visible HTML text; scripts, styles and the document head are dropped."""
+    return _iter_html(extract_text(source, chunk_size))
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _open_zip(source):
+    if isinstance(source, (str, os.PathLike)):
+        return zipfile.ZipFile(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+        return zipfile.ZipFile(source)
+    # Non-seekable streams have to be buffered, zip archives are indexed from the end
+    return zipfile.ZipFile(io.BytesIO(source.read()))
+
+
+@register_extractor(".docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+def extract_docx(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Word document body text, parsed with iterparse so the XML tree is never fully built."""
+    with _open_zip(source) as archive:
+        try:
+            document = archive.open("word/document.xml")
+        except KeyError:
+            raise Exception("error reading the DOCX file")
+
+        with document:
+            parts, size = [], 0
+            for _, elem in ET.iterparse(document, events=("end",)):
+                tag = elem.tag
+                if tag == _W + "t" and elem.text:
+                    parts.append(elem.text)
+                    size += len(elem.text)
+                elif tag == _W + "tab":
+                    parts.append("\t")
+                elif tag in (_W + "br", _W + "cr"):
+                    parts.append("\n")
+                elif tag == _W + "p":
+                    parts.append("\n\n")
+                    elem.clear()
+                    if size >= chunk_size:
+                        yield "".join(parts)
+                        parts, size = [], 0
+            if parts:
+                yield "".join(parts)
+
+
+_OPF = "{http://www.idpf.org/2007/opf}"
+_CONTAINER = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+
+
+def _epub_spine(archive):
+    """Archive member names of the EPUB content documents in reading order."""
+    container = ET.fromstring(archive.read("META-INF/container.xml"))
+    rootfile = container.find(f"{_CONTAINER}rootfiles/{_CONTAINER}rootfile")
+    if rootfile is None:
+        raise Exception("error reading the EPUB file")
+    opf_path = rootfile.get("full-path")
+    opf_dir = posixpath.dirname(opf_path)
+
+    package = ET.fromstring(archive.read(opf_path))
+    manifest = {
+        item.get("id"): item
+        for item in package.iter(f"{_OPF}item")
+    }
+    names = []
+    for itemref in package.iter(f"{_OPF}itemref"):
+        item = manifest.get(itemref.get("idref"))
+        if item is None or "html" not in (item.get("media-type") or ""):
+            continue
+        names.append(posixpath.normpath(posixpath.join(opf_dir, unquote(item.get("href")))))
+    return names
+
+
+@register_extractor(".epub", "application/epub+zip")
+def extract_epub(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """EPUB text, chapter by chapter in spine order."""
+    with _open_zip(source) as archive:
+        try:
+            names = _epub_spine(archive)
+        except (KeyError, ET.ParseError):
+            raise Exception("error reading the EPUB file")
+
+        for name in names:
+            try:
+                chapter = archive.open(name)
+            except KeyError:
+                continue
+            with chapter:
+                blocks = iter(lambda: chapter.read(chunk_size), b"")
+                yield from _iter_html(_iter_decoded(blocks))
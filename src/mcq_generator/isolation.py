@@ -0,0 +1,131 @@
+"""
+Document extraction in memory-limited worker processes.
+
+Extracting a large PDF can take hundreds of megabytes, and a long-running app
+server never gets that memory back. ExtractionPool runs extraction and passage
+selection in separate worker processes capped by an address-space limit and
+returns only the budgeted text for each subject, so the memory of the calling
+process does not grow with document size. A document that exceeds the limit
+fails its request instead of taking the server down.
+"""
+
+import sys
+import errno
+import time
+import signal
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:  # not available on Windows; workers then run without a ceiling
+    resource = None
+
+from src.mcq_generator.ingestion import iter_text
+from src.mcq_generator.retrieval import DEFAULT_TEXT_TOKEN_BUDGET, PreparedDocument
+
+DEFAULT_MEMORY_LIMIT_MB = 1024
+
+# Workers are replaced after this many documents so fragmented heaps are returned to the OS
+TASKS_PER_WORKER = 20
+
+# Seconds to wait for the exit codes of a broken pool's workers
+WORKER_EXIT_TIMEOUT = 1.0
+
+
+class ExtractionMemoryError(Exception):
+    """Raised when a document cannot be extracted within the worker memory limit."""
+
+
+def _limit_memory(limit_bytes):
+    if resource is not None and limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def extract_selections(path, subjects, max_tokens=DEFAULT_TEXT_TOKEN_BUDGET):
+    """
+    Extract a document and select its passages for each subject.
+
+    Runs inside a worker process; only the selected texts are sent back.
+
+    Returns:
+    - dict: subject -> selected text within max_tokens.
+    """
+    try:
+        document = PreparedDocument("".join(iter_text(path)), max_tokens)
+        return {subject: document.text_for(subject) for subject in subjects}
+    except MemoryError:
+        raise ExtractionMemoryError("the document is too large to extract within the memory limit") from None
+    except OSError as e:
+        # mmap and thread creation report an exhausted address space as ENOMEM
+        if e.errno != errno.ENOMEM:
+            raise
+        raise ExtractionMemoryError("the document is too large to extract within the memory limit") from None
+
+
+class ExtractionPool:
+    """
+    Pool of memory-limited extraction worker processes.
+
+    Parameters:
+    - max_workers (int): Documents extracted at the same time.
+    - memory_limit_mb (int): Address-space ceiling per worker; 0 disables it.
+    """
+
+    def __init__(self, max_workers=2, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+        self.max_workers = max_workers
+        self.memory_limit_mb = memory_limit_mb
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            options = {}
+            if sys.version_info >= (3, 11):
+                options["max_tasks_per_child"] = TASKS_PER_WORKER
+            # spawn: forking a multi-threaded server process is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_memory,
+                initargs=(self.memory_limit_mb * 1024 * 1024,),
+                **options
+            )
+        return self._executor
+
+    async def select(self, path, subjects, max_tokens=DEFAULT_TEXT_TOKEN_BUDGET, deadline=None):
+        """
+        Extract a spooled document in a worker and return subject -> selected text.
+
+        The deadline bounds the wait; a cancelled request stops waiting at once
+        while the worker finishes the document in the background.
+        """
+        future = self._get_executor().submit(extract_selections, path, list(dict.fromkeys(subjects)), max_tokens)
+        try:
+            if deadline is None:
+                return await asyncio.wrap_future(future)
+            return await deadline.run(asyncio.wrap_future(future), "extraction")
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next request. Only a worker killed
+            # by SIGKILL (the OOM killer) is reported as too large; spawn or import failures
+            # and other crashes keep their own cause.
+            exit_codes = await asyncio.get_running_loop().run_in_executor(None, self._worker_exit_codes)
+            self.shutdown()
+            if getattr(signal, "SIGKILL", None) is not None and -signal.SIGKILL in exit_codes:
+                raise ExtractionMemoryError("the document is too large to extract within the memory limit") from None
+            raise
+
+    def _worker_exit_codes(self, timeout=WORKER_EXIT_TIMEOUT):
+        # The pool reports the break as soon as a worker's pipe closes, slightly
+        # before the worker can be reaped, so wait briefly for the exit codes
+        processes = list((getattr(self._executor, "_processes", None) or {}).values())
+        until = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, until - time.monotonic()))
+        return [process.exitcode for process in processes]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
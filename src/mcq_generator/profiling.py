@@ -0,0 +1,290 @@
+"""
+Built-in profiling for CLI and app runs.
+
+A Profiler records, while active:
+- cProfile call statistics for the thread that started it,
+- tracemalloc peak memory and the top allocating source lines,
+- a sampled, flamegraph-compatible collapsed stack of every thread,
+- wall-clock spans for each pipeline stage (see span()).
+
+Independently of profiling, record_run() collects lightweight per-run statistics
+(stage latencies, LLM calls, token usage and models) for the analytics store.
+
+write_report() bundles everything into a single zip file that can be attached to
+a ticket: profile.pstats (load with pstats/snakeviz), stacks.collapsed (feed to
+flamegraph.pl or speedscope), spans.json and a human-readable report.txt.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import marshal
+import pstats
+import cProfile
+import uuid
+import zipfile
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+# The profiler recording in this context; concurrent runs each report to their own
+_active_profiler = contextvars.ContextVar("mcq_profiler", default=None)
+
+# tracemalloc is process-wide: it is started by the first profiler and stopped by the last
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = {"count": 0, "started": False}
+
+# Statistics of the run in progress in this context (see record_run)
+_run_stats = contextvars.ContextVar("mcq_run_stats", default=None)
+
+
+@contextmanager
+def span(name):
+    """Time a pipeline stage for the active profiler and run statistics; a no-op otherwise."""
+    stats = _run_stats.get()
+    profiler = _active_profiler.get()
+    if profiler is None and stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        with profiler.span(name) if profiler is not None else nullcontext():
+            yield
+    finally:
+        if stats is not None:
+            stats.add_stage(name, time.perf_counter() - start)
+
+
+class RunStats:
+    """Stage latencies, LLM calls, token usage, models and output counts of one run."""
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.quizzes = 0
+        self.questions = 0
+        self.stages = {}
+        self.models = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_usage(self, llm_name, llm_output):
+        llm_output = llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+            if llm_output.get("model_name"):
+                self.models[llm_name] = llm_output["model_name"]
+
+    def wall_time(self):
+        return time.perf_counter() - self.started
+
+
+@contextmanager
+def record_run():
+    """
+    Collect RunStats for everything run inside, including asyncio tasks it starts.
+
+    Returns:
+    - RunStats: Filled in as the run progresses.
+    """
+    stats = RunStats()
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+
+def current_run():
+    """The RunStats of the run in progress, or None outside record_run()."""
+    return _run_stats.get()
+
+
+def record_usage(llm_name, llm_output):
+    """Called by the LLM wrappers after every call; a no-op outside record_run()."""
+    stats = _run_stats.get()
+    if stats is not None:
+        stats.add_usage(llm_name, llm_output)
+
+
+class _StackSampler(threading.Thread):
+    """Samples the stacks of all threads at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, interval):
+        super().__init__(daemon=True, name="mcq-profiler-sampler")
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(" ", "_"))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """
+    Context manager that profiles everything run inside it.
+
+    Parameters:
+    - sample_interval (float): Seconds between stack samples for the collapsed stacks.
+    - top_allocators (int): Number of allocation sites listed in the report.
+    """
+
+    def __init__(self, sample_interval=0.005, top_allocators=25):
+        self.sample_interval = sample_interval
+        self.top_allocators = top_allocators
+        self.spans = []
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile()
+        self._profiling = False
+        self._sampler = None
+        self._token = None
+        self.started = None
+        self.wall_time = None
+        self.memory_peak = None
+        self.allocators = []
+
+    def __enter__(self):
+        with _tracemalloc_lock:
+            if _tracemalloc_users["count"] == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracemalloc_users["started"] = True
+                elif hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+            _tracemalloc_users["count"] += 1
+        self._sampler = _StackSampler(self.sample_interval)
+        self._sampler.start()
+        self._token = _active_profiler.set(self)
+        self.started = time.perf_counter()
+        try:
+            self._profile.enable()
+            self._profiling = True
+        except ValueError:
+            # Python 3.12+ allows one cProfile per process; a concurrent run keeps it
+            self._profiling = False
+        return self
+
+    def __exit__(self, *exc):
+        if self._profiling:
+            self._profile.disable()
+        self.wall_time = time.perf_counter() - self.started
+        _active_profiler.reset(self._token)
+        self._sampler.stop()
+
+        try:
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            self.allocators = [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top_allocators]
+            ]
+        except RuntimeError:
+            # tracemalloc was stopped by code outside the profiler
+            self.memory_peak = self.memory_peak or 0
+        finally:
+            with _tracemalloc_lock:
+                _tracemalloc_users["count"] -= 1
+                if _tracemalloc_users["count"] == 0 and _tracemalloc_users["started"]:
+                    tracemalloc.stop()
+                    _tracemalloc_users["started"] = False
+        return False
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    "stage": name,
+                    "start_s": round(start - self.started, 4),
+                    "duration_s": round(end - start, 4),
+                    "thread": threading.current_thread().name,
+                })
+
+    def text_report(self, top_functions=40):
+        lines = [
+            "MCQ Generator profile",
+            "=" * 60,
+            f"Wall time: {self.wall_time:.3f}s",
+            f"tracemalloc peak: {self.memory_peak / (1024 * 1024):.2f} MiB",
+            "",
+            "Pipeline stages",
+            "-" * 60,
+        ]
+        for s in sorted(self.spans, key=lambda s: s["start_s"]):
+            lines.append(f"{s['stage']:<28} start {s['start_s']:>8.3f}s  took {s['duration_s']:>8.3f}s  [{s['thread']}]")
+
+        lines += ["", "Top allocators (tracemalloc)", "-" * 60]
+        for a in self.allocators:
+            lines.append(f"{a['size_kb']:>10.1f} KiB  {a['count']:>8} blocks  {a['location']}")
+
+        lines += ["", "cProfile (cumulative)", "-" * 60]
+        if self._profiling:
+            stream = io.StringIO()
+            pstats.Stats(self._profile, stream=stream).sort_stats("cumulative").print_stats(top_functions)
+            lines.append(stream.getvalue())
+        else:
+            lines.append("not recorded: another profiler was active")
+        return "\n".join(lines)
+
+    def write_report(self, path):
+        """
+        Write the profile as a single zip file.
+
+        profile.pstats is left out if cProfile was held by a concurrent run.
+
+        Returns:
+        - str: The path written.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in sorted(self._sampler.counts.items()))
+        summary = {
+            "wall_time_s": round(self.wall_time, 4),
+            "memory_peak_bytes": self.memory_peak,
+            "spans": self.spans,
+            "top_allocators": self.allocators,
+        }
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("report.txt", self.text_report())
+            if self._profiling:
+                zf.writestr("profile.pstats", marshal.dumps(pstats.Stats(self._profile).stats))
+            zf.writestr("stacks.collapsed", collapsed)
+            zf.writestr("spans.json", json.dumps(summary, indent=2))
+        return path
@@ -0,0 +1,320 @@
+import re
+import math
+from collections import Counter, deque
+import numpy as np
+
+# Rough token estimate used for prompt budgeting (~4 characters per token for English text)
+CHARS_PER_TOKEN = 4
+
+# Budget for the {text} slot of TEMPLATE: llama3-8b-8192 has an 8192 token context,
+# 2096 are reserved for the completion and ~600 for the rest of the prompt.
+DEFAULT_TEXT_TOKEN_BUDGET = 5000
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its itself
+just me more most my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves also may might must shall
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Approximate the number of LLM tokens in a piece of text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords and single characters removed."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def split_passages(text, max_passage_tokens=200):
+    """
+    Split extracted text into passages.
+
+    Paragraphs are separated by blank lines. Paragraphs longer than
+    max_passage_tokens (common for PDF extraction, which rarely keeps blank
+    lines) are re-packed sentence by sentence into passages of at most that size.
+    Text without sentence punctuation falls back to line breaks and then to
+    fixed word windows, so no passage exceeds max_passage_tokens.
+
+    Parameters:
+    - text (str): The extracted document text.
+    - max_passage_tokens (int): Upper bound on the estimated size of a passage.
+
+    Returns:
+    - list[str]: Passages in document order.
+    """
+    passages = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_passage_tokens:
+            passages.append(paragraph)
+            continue
+
+        current, current_tokens = [], 0
+        for piece in _split_oversized(paragraph, max_passage_tokens):
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_passage_tokens:
+                passages.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+        if current:
+            passages.append(" ".join(current))
+    return passages
+
+
+def _split_oversized(paragraph, max_tokens):
+    """Pieces of at most max_tokens: sentences, else lines, else word windows."""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        if estimate_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        for line in sentence.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if estimate_tokens(line) <= max_tokens:
+                yield line
+            else:
+                yield from _word_windows(line, max_tokens)
+
+
+def _word_windows(text, max_tokens):
+    """Consecutive runs of words of at most max_tokens; words longer than that are cut."""
+    max_chars = max(1, (max_tokens - 1) * CHARS_PER_TOKEN)
+    current, length = [], 0
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                yield " ".join(current)
+                current, length = [], 0
+            yield word[:max_chars]
+            word = word[max_chars:]
+        if current and length + 1 + len(word) > max_chars:
+            yield " ".join(current)
+            current, length = [], 0
+        length += len(word) + (1 if current else 0)
+        current.append(word)
+    if current:
+        yield " ".join(current)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 index over a list of passages.
+
+    Postings are stored per term as NumPy arrays of (passage id, term frequency),
+    so scoring a query only touches the passages that contain its terms.
+    """
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+
+        postings = {}
+        lengths = np.zeros(len(passages), dtype=np.float64)
+        for doc_id, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+
+        n_docs = max(len(passages), 1)
+        self.doc_lengths = lengths
+        self.avg_doc_length = float(lengths.mean()) if len(passages) and lengths.mean() > 0 else 1.0
+        self.postings = {
+            term: (np.asarray(ids, dtype=np.int64), np.asarray(tfs, dtype=np.float64))
+            for term, (ids, tfs) in postings.items()
+        }
+        self.idf = {
+            term: math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in self.postings.items()
+        }
+        # Denominator normalisation term is shared by every query, compute it once
+        self._norm = self.k1 * (1 - self.b + self.b * lengths / self.avg_doc_length)
+
+    def score(self, query_weights):
+        """
+        Score every passage against a weighted bag of query terms.
+
+        Parameters:
+        - query_weights (dict): Mapping of term -> query weight.
+
+        Returns:
+        - numpy.ndarray: BM25 score per passage.
+        """
+        scores = np.zeros(len(self.passages), dtype=np.float64)
+        for term, weight in query_weights.items():
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            scores[ids] += weight * self.idf[term] * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    def query(self, text):
+        """Score every passage against a free-text query."""
+        return self.score(Counter(tokenize(text)))
+
+    def salience(self, top_terms=50):
+        """
+        Score passages by how much of the document's key vocabulary they carry.
+
+        Key terms are the top_terms with the highest collection frequency x idf,
+        i.e. terms that are both frequent overall and concentrated in few passages.
+        """
+        weights = {
+            term: float(tfs.sum()) * self.idf[term]
+            for term, (_, tfs) in self.postings.items()
+        }
+        top = sorted(weights, key=weights.get, reverse=True)[:top_terms]
+        if not top:
+            return np.zeros(len(self.passages), dtype=np.float64)
+        max_weight = weights[top[0]]
+        return self.score({term: weights[term] / max_weight for term in top})
+
+
+def _normalize(scores):
+    """Scale scores to [0, 1]; constant vectors map to zeros."""
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+def rank_passages(passages, subject=None, relevance_weight=0.6, index=None):
+    """
+    Rank passages by a blend of salience and relevance to the subject.
+
+    Parameters:
+    - passages (list[str]): Passages in document order.
+    - subject (str, optional): The user's subject; ignored if empty.
+    - relevance_weight (float): Share of the final score given to subject relevance.
+    - index (BM25Index, optional): Prebuilt index over the same passages.
+
+    Returns:
+    - numpy.ndarray: Combined score per passage in [0, 1].
+    """
+    index = index or BM25Index(passages)
+    salience = _normalize(index.salience())
+    if subject and tokenize(subject):
+        relevance = _normalize(index.query(subject))
+        if relevance.any():
+            return relevance_weight * relevance + (1 - relevance_weight) * salience
+    return salience
+
+
+def select_passages(text, subject=None, max_tokens=DEFAULT_TEXT_TOKEN_BUDGET,
+                    n_sections=8, max_passage_tokens=200, relevance_weight=0.6):
+    """
+    Pack the most informative passages of a document into a token budget.
+
+    Text that already fits is returned unchanged. Otherwise the document is cut
+    into passages and ranked with BM25 (salience + relevance to the subject).
+    The document is divided into n_sections contiguous sections and passages are
+    taken round-robin, best first, from each section so that the selection covers
+    the whole document instead of clustering in one chapter. Selected passages are
+    returned in their original order.
+
+    Parameters:
+    - text (str): The extracted document text.
+    - subject (str, optional): Subject used to bias the ranking.
+    - max_tokens (int): Token budget for the returned text.
+    - n_sections (int): Number of positional sections used for coverage.
+    - max_passage_tokens (int): Upper bound on the size of a single passage.
+    - relevance_weight (float): Share of the score given to subject relevance.
+
+    Returns:
+    - str: The selected passages joined by blank lines.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # A passage must fit the budget on its own or it can never be selected
+    max_passage_tokens = max(1, min(max_passage_tokens, max_tokens - 1))
+    passages = split_passages(text, max_passage_tokens=max_passage_tokens)
+    return pack_passages(passages, subject, max_tokens, n_sections, relevance_weight)
+
+
+def pack_passages(passages, subject=None, max_tokens=DEFAULT_TEXT_TOKEN_BUDGET,
+                  n_sections=8, relevance_weight=0.6, index=None):
+    """
+    The packing step of select_passages, for passages that were already split.
+
+    Pass a prebuilt BM25Index over the same passages to select for several
+    subjects without re-indexing the document.
+
+    Returns:
+    - str: The selected passages joined by blank lines.
+    """
+    if not passages:
+        return ""
+
+    scores = rank_passages(passages, subject, relevance_weight=relevance_weight, index=index)
+    costs = np.fromiter((estimate_tokens(p) + 1 for p in passages), dtype=np.int64, count=len(passages))
+
+    # Per-section queues of passage ids, best first
+    n_sections = max(1, min(n_sections, len(passages)))
+    section_of = np.arange(len(passages)) * n_sections // len(passages)
+    order = np.argsort(-scores, kind="stable")
+    queues = [deque(order[section_of[order] == s]) for s in range(n_sections)]
+    # Visit the strongest sections first in every round
+    queues.sort(key=lambda q: -scores[q[0]] if q else 0.0)
+
+    selected = []
+    remaining = max_tokens
+    while remaining > 0 and any(queues):
+        for queue in queues:
+            # Skip passages that no longer fit; a smaller one further down may still fit
+            while queue and costs[queue[0]] > remaining:
+                queue.popleft()
+            if queue:
+                doc_id = queue.popleft()
+                selected.append(doc_id)
+                remaining -= costs[doc_id]
+
+    return "\n\n".join(passages[i] for i in sorted(selected))
+
+
+class PreparedDocument:
+    """
+    Extracted document text, preprocessed once for any number of configurations.
+
+    Parameters:
+    - text (str): The extracted text, e.g. from read_file.
+    - max_tokens (int): Token budget for the text sent with each request.
+    """
+
+    def __init__(self, text, max_tokens=DEFAULT_TEXT_TOKEN_BUDGET):
+        self.text = text
+        self.max_tokens = max_tokens
+        self._passages = None
+        self._index = None
+        self._selected = {}
+
+    def text_for(self, subject):
+        """The passages selected for a subject within the budget; computed once per subject."""
+        if estimate_tokens(self.text) <= self.max_tokens:
+            return self.text
+        key = (subject or "").strip().lower()
+        if key not in self._selected:
+            if self._passages is None:
+                self._passages = split_passages(self.text)
+                self._index = BM25Index(self._passages)
+            self._selected[key] = pack_passages(self._passages, subject, self.max_tokens, index=self._index)
+        return self._selected[key]
@@ -0,0 +1,140 @@
+"""
+Disk-backed per-session storage for the Streamlit app.
+
+Each session gets a directory holding its spooled uploads and generated quizzes;
+st.session_state only keeps ids that refer to them, so the app's memory per user
+stays flat regardless of document or quiz size. Directories of sessions that have
+been idle for too long are removed by evict_idle_sessions().
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+
+DEFAULT_SESSION_ROOT = os.path.join(tempfile.gettempdir(), "mcq_sessions")
+
+# Bytes copied at a time when spooling an upload to disk
+SPOOL_CHUNK_SIZE = 1 << 20
+
+_sweep_lock = threading.Lock()
+_last_sweep = {}
+
+
+class SessionStore:
+    """
+    Files of one app session.
+
+    Parameters:
+    - session_id (str): Random id kept in st.session_state.
+    - root (str): Directory holding all session directories.
+    """
+
+    def __init__(self, session_id, root=DEFAULT_SESSION_ROOT):
+        self.session_id = session_id
+        self.path = os.path.join(root, session_id)
+
+    def touch(self):
+        """Mark the session as active (its directory's modification time is the last activity)."""
+        os.makedirs(self.path, exist_ok=True)
+        os.utime(self.path)
+
+    def spool_upload(self, upload_file):
+        """
+        Copy an uploaded file to the session directory in chunks.
+
+        Returns:
+        - str: Path of the spooled file, keeping the upload's extension.
+        """
+        self.touch()
+        extension = os.path.splitext(getattr(upload_file, "name", "") or "")[1].lower()
+        fd, path = tempfile.mkstemp(suffix=extension, prefix="upload_", dir=self.path)
+        upload_file.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(upload_file, f, SPOOL_CHUNK_SIZE)
+        return path
+
+    def put_quiz(self, quiz_data, review, review_cards):
+        """
+        Store a generated quiz with its review.
+
+        Returns:
+        - str: The quiz id.
+        """
+        self.touch()
+        quiz_id = uuid.uuid4().hex
+        tmp_path = os.path.join(self.path, f"{quiz_id}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"quiz": quiz_data, "review": review, "review_cards": review_cards}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._quiz_path(quiz_id))
+        return quiz_id
+
+    def get_quiz(self, quiz_id):
+        """
+        A stored quiz, or None if it was evicted.
+
+        Returns:
+        - dict | None: 'quiz', 'review' and 'review_cards'. Shared between reruns; do not modify.
+        """
+        path = self._quiz_path(quiz_id)
+        try:
+            return _load_quiz(path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def delete_quiz(self, quiz_id):
+        self.remove(self._quiz_path(quiz_id))
+
+    def remove(self, path):
+        """Delete a file of this session (e.g. a spooled upload once extracted)."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _quiz_path(self, quiz_id):
+        return os.path.join(self.path, f"{quiz_id}.json")
+
+
+@lru_cache(maxsize=64)
+def _load_quiz(path, mtime_ns):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def evict_idle_sessions(max_idle_seconds, root=DEFAULT_SESSION_ROOT, min_interval=60):
+    """
+    Remove the directories of sessions idle for longer than max_idle_seconds.
+
+    Cheap to call on every rerun: the directory is scanned at most once per min_interval seconds.
+
+    Returns:
+    - int: Number of sessions evicted.
+    """
+    now = time.time()
+    with _sweep_lock:
+        if now - _last_sweep.get(root, 0) < min_interval:
+            return 0
+        _last_sweep[root] = now
+
+    evicted = 0
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            idle = now - entry.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if entry.is_dir() and idle > max_idle_seconds:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            evicted += 1
+    return evicted
@@ -1,32 +1,58 @@
 import os
 import re
-import PyPDF2
 import json
 import pandas as pd
 from datetime import datetime
 import streamlit as st
 
-def read_file(file):
-    if file.name.endswith(".pdf"):
-        try:
-            pdf_reader=PyPDF2.PdfFileReader(file)
-            text=""
-            for page in pdf_reader.pages:
-                text+=page.extract_text()
-            return text
-            
-        except Exception as e:
-            raise Exception("error reading the PDF file")
-        
-    elif file.name.endswith(".txt"):
-        return file.read().decode("utf-8")
-    
-    else:
-        raise Exception(
-            "unsupported file format only pdf and text file suppoted"
-        )
+from src.mcq_generator.ingestion import iter_text
+from src.mcq_generator.profiling import span
 
-import streamlit as st
+def read_file(file, deadline=None):
+    """
+    Extract the full text of an uploaded file or path.
+
+    The extractor is picked from the ingestion registry by extension or MIME type
+    (PDF, TXT, Markdown, HTML, DOCX, EPUB). Use iter_text to stream large
+    documents chunk by chunk instead. If a deadline is given it is checked after
+    every chunk, so extraction stops as soon as the request is cancelled or out of time.
+    """
+    with span("extraction"):
+        if deadline is None:
+            return "".join(iter_text(file))
+
+        chunks = []
+        for chunk in iter_text(file):
+            deadline.check("extraction")
+            chunks.append(chunk)
+        return "".join(chunks)
+
+def format_review_sections(review):
+    """
+    Pre-render the quiz review as HTML cards.
+
+    Called once when generation finishes so that reruns of the app only emit the
+    cached cards instead of re-splitting and re-formatting the review text.
+
+    Parameters:
+    - review (str): The review text returned by the review chain.
+
+    Returns:
+    - list[str]: One HTML card per review section.
+    """
+    cards = []
+    formatted_review = review.replace("\n", "\n\n")
+    for section in formatted_review.split("\n\n"):
+        if section.strip():
+            title_line = section.split("\n")[0]  # First line as title
+            body = "\n".join(section.split("\n")[1:])  # Rest as body
+            cards.append(f"""
+<div style="background-color:#f0f2f6;padding:15px;border-radius:10px;margin-bottom:10px;">
+    <h5 style="color:#0f62fe">{title_line.strip('**')}</h5>
+    <p>{body}</p>
+</div>
+""")
+    return cards
 
 def run_quiz_app(quiz_data):
     st.title(quiz_data["quiz_info"]["title"])
@@ -81,20 +107,22 @@ def restart_quiz():
 
 
 
-def save_mcqs_to_csv(json_string, filename=None):
+def save_mcqs_to_csv(json_string, filename=None, deadline=None):
     """
     Save quiz data (quiz_info + questions) from a JSON string to CSV files.
 
     Parameters:
     - json_string (str): The quiz data as a JSON string.
     - filename (str, optional): The base filename for CSVs. If not provided, generates one.
+    - deadline (Deadline, optional): Checked before anything is written.
 
     Returns:
     - tuple: Filenames of the saved CSV files (quiz_info_file, questions_file).
     """
     try:
         # Parse JSON string
-        quiz_data = json.loads(json_string)
+        with span("JSON parsing"):
+            quiz_data = json.loads(json_string)
     except json.JSONDecodeError as e:
         print(f"❌ Failed to parse JSON string: {e}")
         return
@@ -103,9 +131,13 @@ def save_mcqs_to_csv(json_string, filename=None):
         print("❌ No quiz data to save")
         return
 
+    if deadline is not None:
+        deadline.check("export")
+
     # Create DataFrames
-    quiz_info_df = pd.DataFrame([quiz_data.get("quiz_info", {})])
-    questions_df = pd.DataFrame(quiz_data["questions"])
+    with span("export: DataFrames"):
+        quiz_info_df = pd.DataFrame([quiz_data.get("quiz_info", {})])
+        questions_df = pd.DataFrame(quiz_data["questions"])
 
     # Generate base filename if not provided
     if filename is None:
@@ -120,8 +152,9 @@ def save_mcqs_to_csv(json_string, filename=None):
     questions_file = f"{filename_base}_questions.csv"
 
     # Save to CSV
-    quiz_info_df.to_csv(quiz_info_file, index=False, encoding="utf-8")
-    questions_df.to_csv(questions_file, index=False, encoding="utf-8")
+    with span("export: CSV"):
+        quiz_info_df.to_csv(quiz_info_file, index=False, encoding="utf-8")
+        questions_df.to_csv(questions_file, index=False, encoding="utf-8")
 
     print(f"✅ Quiz Info saved to: {quiz_info_file}")
     print(f"✅ Questions saved to: {questions_file}")
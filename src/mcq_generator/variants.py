@@ -0,0 +1,205 @@
+import re
+import json
+import random
+
+# Options that refer to their neighbours ("All of the above") keep their position
+PINNED_OPTION_RE = re.compile(r"\b(all|none|both|neither|any) of the (above|following)\b", re.IGNORECASE)
+
+# Options that name other options by letter ("Both A and B", "A or C"); such questions keep their option order
+LETTER_OPTION_RE = re.compile(r"\b[A-H](?:\s*[,&/]\s*|\s+(?:and|or|nor)\s+)[A-H]\b", re.IGNORECASE)
+
+# Letter references in explanations ("why A is correct", "the answer is B", "(C)", "Both A and D")
+LETTER_REFERENCE_RE = re.compile(
+    r"\b(?:[Oo]ptions?|[Aa]nswers?|[Cc]hoices?)(?:\s+is)?:?\s+[A-Ha-h](?:(?:\s*[,&/]\s*|\s+(?:and|or)\s+)[A-Ha-h])*\b"
+    r"|\b(?:[Bb]oth|[Nn]either|[Ee]ither)\s+[A-Ha-h]\s+(?:and|or|nor)\s+[A-Ha-h]\b"
+    r"|\([A-Ha-h]\)"
+    r"|\b[A-Ha-h](?=\s+is\s+(?:the\s+)?(?:in)?correct\b)"
+)
+LETTER_RE = re.compile(r"\b[A-Ha-h]\b")
+
+
+def validate_quiz(quiz):
+    """
+    Check that a quiz follows the Response.json shape closely enough to be permuted.
+
+    Raises:
+    - Exception: If questions are missing, or an answer is not one of its options.
+    """
+    questions = quiz.get("questions") if isinstance(quiz, dict) else None
+    if not questions:
+        raise Exception("quiz has no questions")
+    for q in questions:
+        options = q.get("options")
+        if not isinstance(options, dict) or not options:
+            raise Exception(f"question {q.get('id')} has no options")
+        if q.get("correct_answer") not in options:
+            raise Exception(f"question {q.get('id')} has an invalid correct_answer: {q.get('correct_answer')!r}")
+
+
+def _option_layout(q):
+    """
+    Per-question data that every variant reuses: (letters, texts, movable, explanation).
+
+    movable lists the option slots that may be permuted (none when options name other
+    options by letter); explanation is the explanation split into alternating plain
+    text and referenced letters, or None.
+    """
+    letters = sorted(q["options"])
+    texts = [q["options"][letter] for letter in letters]
+    if any(LETTER_OPTION_RE.search(str(text)) for text in texts):
+        movable = []
+    else:
+        movable = [i for i, text in enumerate(texts) if not PINNED_OPTION_RE.search(str(text))]
+
+    explanation = q.get("explanation")
+    if isinstance(explanation, str):
+        pieces, start = [], 0
+        for reference in LETTER_REFERENCE_RE.finditer(explanation):
+            for letter in LETTER_RE.finditer(explanation, reference.start(), reference.end()):
+                pieces += [explanation[start:letter.start()], letter.group(0)]
+                start = letter.end()
+        explanation = pieces + [explanation[start:]]
+    else:
+        explanation = None
+    return letters, texts, movable, explanation
+
+
+def _shuffle_options(q, rng, layout=None):
+    """
+    Return (options, correct_answer, letter_map) with option texts permuted over the same letters.
+
+    letter_map maps each original letter to the letter its text moved to. Questions
+    whose options name other options by letter are left in their original order.
+    """
+    letters, texts, movable, _ = layout or _option_layout(q)
+    order = list(range(len(letters)))
+    shuffled = movable[:]
+    rng.shuffle(shuffled)
+    for slot, source in zip(movable, shuffled):
+        order[slot] = source
+
+    options = {letter: texts[source] for letter, source in zip(letters, order)}
+    letter_map = {letters[source]: letter for letter, source in zip(letters, order)}
+    return options, letter_map[q["correct_answer"]], letter_map
+
+
+def remap_letters(text, letter_map):
+    """Rewrite the option letters referenced in a text (e.g. an explanation) after a shuffle."""
+    if not isinstance(text, str) or all(old == new for old, new in letter_map.items()):
+        return text
+
+    def remap_reference(match):
+        return LETTER_RE.sub(lambda m: letter_map.get(m.group(0), m.group(0)), match.group(0))
+
+    return LETTER_REFERENCE_RE.sub(remap_reference, text)
+
+
+def make_variant(quiz, variant_number, seed=0, questions_per_variant=None,
+                 shuffle_questions=True, shuffle_options=True, layouts=None):
+    """
+    Build one variant of a quiz without any LLM calls.
+
+    Every variant is seeded from (seed, variant_number), so any single variant can
+    be regenerated on its own and the same inputs always give the same variant.
+
+    Parameters:
+    - quiz (dict): A validated quiz in the Response.json shape.
+    - variant_number (int): Index of the variant, starting at 1.
+    - seed (int | str): Base seed shared by all variants of a sitting.
+    - questions_per_variant (int, optional): Sample this many questions from the pool.
+    - shuffle_questions (bool): Permute question order.
+    - shuffle_options (bool): Permute option order and remap correct_answer and the
+      letters referenced in the explanation.
+    - layouts (list, optional): Per-question layouts from _option_layout, computed once
+      by generate_variants; built on demand otherwise.
+
+    Returns:
+    - dict: The variant in the Response.json shape. Questions are renumbered from 1
+      and keep the original id as "source_id".
+    """
+    rng = random.Random(f"{seed}:{variant_number}")
+    pool = quiz["questions"]
+
+    if questions_per_variant is not None and questions_per_variant < len(pool):
+        picked = rng.sample(range(len(pool)), questions_per_variant)
+        if not shuffle_questions:
+            picked.sort()
+    else:
+        picked = list(range(len(pool)))
+        if shuffle_questions:
+            rng.shuffle(picked)
+
+    questions = []
+    for new_id, index in enumerate(picked, 1):
+        q = pool[index]
+        variant_q = dict(q)
+        if shuffle_options:
+            layout = layouts[index] if layouts else _option_layout(q)
+            options, correct, letter_map = _shuffle_options(q, rng, layout)
+            explanation = layout[3]
+            if explanation and len(explanation) > 1 and any(old != new for old, new in letter_map.items()):
+                variant_q["explanation"] = "".join(
+                    letter_map.get(piece, piece) if i % 2 else piece for i, piece in enumerate(explanation)
+                )
+        else:
+            options, correct = dict(q["options"]), q["correct_answer"]
+        variant_q.update({
+            "id": new_id,
+            "source_id": q.get("id", index + 1),
+            "options": options,
+            "correct_answer": correct,
+        })
+        questions.append(variant_q)
+
+    quiz_info = dict(quiz.get("quiz_info", {}))
+    quiz_info.update({"variant": variant_number, "seed": seed, "total_questions": len(questions)})
+    return {"quiz_info": quiz_info, "questions": questions}
+
+
+def answer_key(variant):
+    """Map question id -> correct option letter for one variant."""
+    return {q["id"]: q["correct_answer"] for q in variant["questions"]}
+
+
+def generate_variants(quiz, n, seed=0, questions_per_variant=None,
+                      shuffle_questions=True, shuffle_options=True):
+    """
+    Generate n variants of a quiz, e.g. one per student to prevent copying.
+
+    Parameters:
+    - quiz (dict | str): A quiz in the Response.json shape, or its JSON string.
+    - n (int): Number of variants.
+    - seed (int | str): Base seed; the same seed reproduces the same variants.
+    - questions_per_variant (int, optional): Sample a subset of the pool per variant.
+
+    Returns:
+    - list[dict]: Variants numbered 1..n.
+    """
+    if isinstance(quiz, str):
+        quiz = json.loads(quiz)
+    validate_quiz(quiz)
+    if questions_per_variant is not None and questions_per_variant < 1:
+        raise Exception("questions_per_variant must be at least 1")
+
+    layouts = [_option_layout(q) for q in quiz["questions"]] if shuffle_options else None
+    return [
+        make_variant(quiz, i, seed, questions_per_variant, shuffle_questions, shuffle_options, layouts)
+        for i in range(1, n + 1)
+    ]
+
+
+def save_variants(variants, filename):
+    """
+    Save variants and their answer keys to a single JSON file.
+
+    Returns:
+    - str: The filename written.
+    """
+    payload = {
+        "variants": variants,
+        "answer_keys": {str(v["quiz_info"]["variant"]): answer_key(v) for v in variants},
+    }
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"✅ {len(variants)} quiz variants saved to: {filename}")
+    return filename
@@ -1,14 +1,25 @@
 import os
 import json
+import time
+import uuid
+import asyncio
 import traceback
+import contextvars
+from functools import partial
 from datetime import datetime
 import pandas as pd
 from dotenv import load_dotenv
 import streamlit as st
 
-from src.mcq_generator.utils import read_file, save_mcqs_to_csv
+from src.mcq_generator.utils import save_mcqs_to_csv, format_review_sections
 from src.mcq_generator.logger import logging
-from src.mcq_generator.MCQgenerator import generate_evaluate_chain
+from src.mcq_generator.fanout import agenerate_configurations, configuration_matrix, TONES
+from src.mcq_generator.isolation import ExtractionPool, ExtractionMemoryError, DEFAULT_MEMORY_LIMIT_MB
+from src.mcq_generator.sessions import SessionStore, evict_idle_sessions, DEFAULT_SESSION_ROOT
+from src.mcq_generator.deadline import BackgroundJob, Deadline, DeadlineExceeded
+from src.mcq_generator.profiling import Profiler, span, record_run
+from src.mcq_generator.analytics import record_generated_quiz, record_finished_run
+from src.mcq_generator.compact import compact_schema
 
 # Load environment variables
 load_dotenv()
@@ -17,20 +28,315 @@ load_dotenv()
 with open("Response.json", "r") as f:
     RESPONSE_JSON = json.load(f)
 
+# Token-minimal schema sent with every generation request, computed once
+RESPONSE_SCHEMA = compact_schema(RESPONSE_JSON)
+
+# Opt-in hedged generation (see src/mcq_generator/hedging.py)
+HEDGE_GENERATION = os.getenv("MCQ_HEDGE", "").lower() in ("1", "true", "yes")
+
+# End-to-end time budget for one generation request, in seconds
+GENERATION_TIMEOUT = float(os.getenv("MCQ_TIMEOUT", "120"))
+
+# Set to a directory to write a profiling report for every generation
+PROFILE_DIR = os.getenv("MCQ_PROFILE", "")
+
+# Uploads are extracted in worker processes capped at this much memory each
+EXTRACTION_MEMORY_MB = int(os.getenv("MCQ_EXTRACTION_MEMORY_MB", str(DEFAULT_MEMORY_LIMIT_MB)))
+EXTRACTION_WORKERS = int(os.getenv("MCQ_EXTRACTION_WORKERS", "2"))
+
+# Spooled uploads and generated quizzes live on disk, per session; idle sessions are evicted
+SESSION_ROOT = os.getenv("MCQ_SESSION_DIR", DEFAULT_SESSION_ROOT)
+SESSION_IDLE_SECONDS = float(os.getenv("MCQ_SESSION_IDLE", "1800"))
+
+# Questions rendered per page in the quiz tab
+QUESTIONS_PER_PAGE = 5
+
+# Partial reruns: st.fragment (Streamlit >= 1.37), experimental_fragment on older releases
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 # App Title
 st.title("🎯 MCQ Generator & Interactive Quiz App")
 
-# Initialize session state
-if "quiz_data" not in st.session_state:
-    st.session_state.quiz_data = None
-if "show_quiz" not in st.session_state:
-    st.session_state.show_quiz = False
-if "quiz_review" not in st.session_state:
-    st.session_state.quiz_review = None
+# Initialize session state; quizzes are kept in the session store and referenced by id
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "last_active" not in st.session_state:
+    st.session_state.last_active = time.time()
+if "quiz_id" not in st.session_state:
+    st.session_state.quiz_id = None
+if "upload_key" not in st.session_state:
+    st.session_state.upload_key = 0
 if "user_answers" not in st.session_state:
     st.session_state.user_answers = {}
 if "quiz_submitted" not in st.session_state:
     st.session_state.quiz_submitted = False
+if "quiz_page" not in st.session_state:
+    st.session_state.quiz_page = 0
+if "quiz_results" not in st.session_state:
+    st.session_state.quiz_results = None
+if "generation_job" not in st.session_state:
+    st.session_state.generation_job = None
+if "generation_cancelled" not in st.session_state:
+    st.session_state.generation_cancelled = False
+if "quiz_set" not in st.session_state:
+    st.session_state.quiz_set = {}
+
+
+@st.cache_resource
+def extraction_pool():
+    """Worker processes shared by all sessions."""
+    return ExtractionPool(EXTRACTION_WORKERS, EXTRACTION_MEMORY_MB)
+
+
+def session_store():
+    return SessionStore(st.session_state.session_id, SESSION_ROOT)
+
+
+async def run_generation(pool, store, upload_path, upload_name, configurations, deadline):
+    """Extraction, generation and export for one request, all bound by the same deadline."""
+    if not PROFILE_DIR:
+        return await _run_generation(pool, store, upload_path, upload_name, configurations, deadline)
+
+    profiler = Profiler()
+    try:
+        with profiler:
+            return await _run_generation(pool, store, upload_path, upload_name, configurations, deadline)
+    finally:
+        report = os.path.join(PROFILE_DIR, f"mcq_profile_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.zip")
+        try:
+            profiler.write_report(report)
+            logging.info(f"Profile saved: {report}")
+        except Exception:
+            # A failed report must not fail the user's generation
+            logging.exception(f"Could not write profile {report}")
+
+
+async def _run_generation(pool, store, upload_path, upload_name, configurations, deadline):
+    # Stage latencies, tokens and generated quizzes go to the analytics store (see analytics.py)
+    with record_run() as stats:
+        status = "failed"
+        try:
+            responses = await _generate(pool, store, upload_path, upload_name, configurations, deadline)
+            status = "ok" if stats.quizzes == len(responses) else "partial" if stats.quizzes else "failed"
+            return responses
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            record_finished_run(stats, "app", status)
+
+
+async def _generate(pool, store, upload_path, upload_name, configurations, deadline):
+    loop = asyncio.get_running_loop()
+    # Extract once, in a memory-limited worker; only the text selected per subject comes back
+    try:
+        with span("extraction"):
+            selections = await pool.select(upload_path, [subject for _, subject, _ in configurations], deadline=deadline)
+    finally:
+        store.remove(upload_path)
+    responses = await agenerate_configurations(
+        selections, configurations, RESPONSE_SCHEMA, deadline, hedge=HEDGE_GENERATION
+    )
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    for (number, subject, tone), response in responses.items():
+        if isinstance(response, BaseException) or not response.get("fixed_quiz"):
+            continue
+        try:
+            record_generated_quiz(json.loads(response["fixed_quiz"]), "app", tone=tone, document=upload_name)
+        except json.JSONDecodeError:
+            pass
+        filename = None
+        if len(responses) > 1:
+            filename = f"{subject.replace(' ', '_').lower()}_{tone.lower()}_{number}_mcqs_{timestamp}"
+        # Run in a copy of this context so export spans reach this run's profiler and stats
+        export = partial(save_mcqs_to_csv, response["fixed_quiz"], filename, deadline=deadline)
+        await loop.run_in_executor(None, contextvars.copy_context().run, export)
+    return responses
+
+
+def configuration_label(configuration):
+    number, subject, tone = configuration
+    return f"{number} MCQs · {tone} · {subject}"
+
+
+def cancel_generation():
+    """Cancel button callback: stop the running request and free its worker thread."""
+    job = st.session_state.generation_job
+    if job is not None:
+        job.cancel()
+    st.session_state.generation_job = None
+    st.session_state.generation_cancelled = True
+
+
+def show_generation_results(responses):
+    """Store every successful quiz of the set and load the first one into the quiz tab."""
+    failed = {c: r for c, r in responses.items() if isinstance(r, BaseException)}
+    if len(failed) == len(responses):
+        raise next(iter(failed.values()))
+    for configuration, error in failed.items():
+        st.warning(f"⚠️ {configuration_label(configuration)} failed: {error}")
+
+    discard_quizzes()
+    store = session_store()
+    quiz_set = {}
+    for configuration, response in responses.items():
+        if configuration in failed or not response.get("fixed_quiz"):
+            continue
+        try:
+            quiz_data = json.loads(response["fixed_quiz"])
+        except json.JSONDecodeError as e:
+            st.error(f"❌ Error parsing quiz data for {configuration_label(configuration)}: {e}")
+            continue
+        review = meaningful_review(response) or (
+            "⚠️ *No detailed analysis available.*\n\n"
+            "The quiz was generated successfully but the analysis section could not be created. "
+            "This could happen due to insufficient text input, a token limit issue or the time limit in the backend."
+        )
+        quiz_set[configuration_label(configuration)] = store.put_quiz(quiz_data, review, format_review_sections(review))
+
+    if not quiz_set:
+        st.error("⚠️ Quiz generation failed. Please try again.")
+        return
+    st.session_state.quiz_set = quiz_set
+    st.session_state.quiz_choice = next(iter(quiz_set))
+    choose_quiz()
+
+    first = next(r for c, r in responses.items() if configuration_label(c) == st.session_state.quiz_choice)
+    if not meaningful_review(first):
+        st.warning("⚠️ The quiz analysis could not be generated properly. Showing default analysis.")
+
+    st.success("✅ MCQs generated successfully! Saved as CSV." if len(quiz_set) == 1 else
+               f"✅ {len(quiz_set)} quizzes generated successfully! Saved as CSV. Pick one in the quiz tab.")
+
+    # Debug raw review
+    with st.expander("🔍 Debug: Raw Review Output"):
+        st.code(current_quiz()["review"], language="text")
+
+
+def meaningful_review(response):
+    """The review text, or an empty string if the model did not produce a real analysis."""
+    review = response.get("review", "").strip()
+    if review.lower() in ["here is the analysis of the quiz", "analysis unavailable"]:
+        return ""
+    return review
+
+
+def choose_quiz():
+    """Quiz selector callback: switch to another quiz of the generated set."""
+    st.session_state.quiz_id = st.session_state.quiz_set[st.session_state.quiz_choice]
+    clear_answers()  # reset answers, submission and page
+
+
+def current_quiz():
+    """
+    The session's current quiz from the store.
+
+    Returns:
+    - dict | None: 'quiz', 'review' and 'review_cards'; None if there is none or it was evicted.
+    """
+    if st.session_state.quiz_id is None:
+        return None
+    record = session_store().get_quiz(st.session_state.quiz_id)
+    if record is None:
+        reset_session()
+    return record
+
+
+def discard_quizzes():
+    """Delete the session's stored quizzes and forget them."""
+    store = session_store()
+    for quiz_id in st.session_state.quiz_set.values():
+        store.delete_quiz(quiz_id)
+    st.session_state.quiz_set = {}
+    st.session_state.quiz_id = None
+    clear_answers()
+
+
+def reset_session():
+    """Drop everything the session references, e.g. after it was idle for too long."""
+    discard_quizzes()
+    session_store().clear()
+
+
+def clear_answers():
+    """Forget the user's answers, results and radio selections."""
+    for key in [k for k in st.session_state if str(k).startswith("q_")]:
+        del st.session_state[key]
+    st.session_state.user_answers = {}
+    st.session_state.quiz_submitted = False
+    st.session_state.quiz_results = None
+    st.session_state.quiz_page = 0
+
+
+def store_answer(question_id):
+    """Radio on_change callback: record the chosen option letter (A/B/C/D)."""
+    choice = st.session_state.get(f"q_{question_id}")
+    if choice is not None:
+        st.session_state.user_answers[question_id] = choice[0]
+
+
+def submit_quiz():
+    """Grade the quiz once, at submission, instead of on every rerun."""
+    record = current_quiz()
+    if record is None:
+        return
+    answers = st.session_state.user_answers
+    st.session_state.quiz_results = {
+        q["id"]: answers.get(q["id"]) == q["correct_answer"]
+        for q in record["quiz"]["questions"]
+    }
+    st.session_state.quiz_submitted = True
+
+
+@fragment
+def render_question(q):
+    """One question per fragment: answering it reruns only this fragment."""
+    options = [f"{key}. {value}" for key, value in q['options'].items()]
+    answer = st.session_state.user_answers.get(q['id'])
+    index = next((i for i, option in enumerate(options) if option[0] == answer), None)
+    st.radio(
+        f"❓ Q{q['id']}: {q['question']}",
+        options,
+        index=index,
+        key=f"q_{q['id']}",
+        on_change=store_answer,
+        args=(q['id'],),
+        disabled=st.session_state.quiz_submitted  # Lock after submission
+    )
+
+
+def render_result(q):
+    correct_ans = q['correct_answer']
+    if st.session_state.quiz_results.get(q['id']):
+        st.success(f"✅ Q{q['id']} Correct! ({correct_ans})")
+    else:
+        st.error(f"❌ Q{q['id']} Wrong. Correct Answer: {correct_ans}")
+    st.markdown(f"**💡 Explanation:** {q['explanation']}")
+
+
+def change_page(step):
+    st.session_state.quiz_page += step
+
+
+def render_pagination(total_pages):
+    if total_pages <= 1:
+        return
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        st.button("⬅️ Previous", on_click=change_page, args=(-1,), disabled=st.session_state.quiz_page == 0)
+    with info_col:
+        st.markdown(f"Page **{st.session_state.quiz_page + 1}** of **{total_pages}**")
+    with next_col:
+        st.button("Next ➡️", on_click=change_page, args=(1,), disabled=st.session_state.quiz_page >= total_pages - 1)
+
+
+# Sessions idle for too long start over; other sessions' stale files are swept periodically
+if time.time() - st.session_state.last_active > SESSION_IDLE_SECONDS:
+    reset_session()
+    st.info("ℹ️ Your session was idle for a while, so its quizzes were cleared.")
+st.session_state.last_active = time.time()
+session_store().touch()
+evict_idle_sessions(SESSION_IDLE_SECONDS, SESSION_ROOT)
 
 # Tabs for clean UI
 tab1, tab2 = st.tabs(["📄 MCQ Generator", "📊 Review & Take Quiz"])
@@ -40,74 +346,70 @@ tab1, tab2 = st.tabs(["📄 MCQ Generator", "📊 Review & Take Quiz"])
 # ==========================
 with tab1:
     st.header("📄 Generate MCQs from Your File")
-    st.markdown("Upload a PDF or text file and configure options to generate MCQs.")
+    st.markdown("Upload a PDF, TXT, Markdown, HTML, DOCX or EPUB file and configure options to generate MCQs.")
 
     with st.form("upload_file"):
         # Upload the file
-        upload_file = st.file_uploader("Upload a PDF or Text file")
+        upload_file = st.file_uploader("Upload a document", type=["pdf", "txt", "md", "markdown", "html", "htm", "docx", "epub"],
+                                       key=f"upload_{st.session_state.upload_key}")
 
         # INPUT Fields
         mcq_count = st.slider("Number of MCQs to generate", min_value=3, max_value=20, value=5)
         subject = st.text_input("Enter the subject", max_chars=30, placeholder="e.g. Computer Vision")
-        tone = st.selectbox("Select complexity level", ["Simple", "Moderate", "Complex"], index=0)
+        tone = st.selectbox("Select complexity level", list(TONES), index=0)
+
+        # One extraction, many configurations
+        with st.expander("🧮 Generate several versions"):
+            extra_tones = st.multiselect("Also generate at these complexity levels", list(TONES))
+            extra_subjects = st.text_input("Also generate for these subjects (comma separated)",
+                                           placeholder="e.g. Robotics, Medical Imaging")
 
         # Submit button
-        button = st.form_submit_button("🚀 Generate MCQs")
+        button = st.form_submit_button("🚀 Generate MCQs", disabled=st.session_state.generation_job is not None)
 
         if button:
             if not upload_file:
-                st.error("❌ Please upload a PDF or text file before generating MCQs.")
+                st.error("❌ Please upload a document before generating MCQs.")
             elif not subject.strip():
                 st.error("❌ Please enter the subject.")
             else:
-                with st.spinner("⏳ Generating MCQs... This may take a few seconds..."):
-                    try:
-                        text = read_file(upload_file)
-                        response = generate_evaluate_chain({
-                            "text": text,
-                            "number": mcq_count,
-                            "subject": subject,
-                            "tone": tone,
-                            "response_json": json.dumps(RESPONSE_JSON)
-                        })
-
-                        quiz = response.get("fixed_quiz")
-                        review = response.get("review", "").strip()
-
-                        if not quiz:
-                            st.error("⚠️ Quiz generation failed. Please try again.")
-                        else:
-                            try:
-                                quiz_data = json.loads(quiz)
-                                st.session_state.quiz_data = quiz_data
-                                st.session_state.show_quiz = True
-
-                                # Validate if the review is meaningful
-                                if not review or review.lower() in ["here is the analysis of the quiz", "analysis unavailable"]:
-                                    st.warning("⚠️ The quiz analysis could not be generated properly. Showing default analysis.")
-                                    review = (
-                                        "⚠️ *No detailed analysis available.*\n\n"
-                                        "The quiz was generated successfully but the analysis section could not be created. "
-                                        "This could happen due to insufficient text input or a token limit issue in the backend."
-                                    )
-
-                                st.session_state.quiz_review = review
-                                st.session_state.user_answers = {}  # reset answers
-                                st.session_state.quiz_submitted = False  # reset submission
-
-                                st.success("✅ MCQs generated successfully! Saved as CSV.")
-                                save_mcqs_to_csv(quiz)
-
-                                # Debug raw review
-                                with st.expander("🔍 Debug: Raw Review Output"):
-                                    st.code(review, language="text")
-
-                            except json.JSONDecodeError as e:
-                                st.error(f"❌ Error parsing quiz data: {e}")
-
-                    except Exception as e:
-                        traceback.print_exception(type(e), e, e.__traceback__)
-                        st.error("❌ An error occurred while generating MCQs.")
+                subjects = [subject.strip()] + [s.strip() for s in extra_subjects.split(",") if s.strip()]
+                tones = [tone] + [t for t in extra_tones if t != tone]
+                configurations = configuration_matrix([mcq_count], subjects, tones)
+                # Spool the upload to disk and reset the uploader so Streamlit releases its in-memory copy
+                store = session_store()
+                upload_path, upload_name = store.spool_upload(upload_file), upload_file.name
+                st.session_state.upload_key += 1
+                pool = extraction_pool()
+                st.session_state.generation_job = BackgroundJob(
+                    partial(run_generation, pool, store, upload_path, upload_name, configurations),
+                    Deadline(GENERATION_TIMEOUT)
+                )
+
+    if st.session_state.generation_cancelled:
+        st.warning("⛔ Generation cancelled.")
+        st.session_state.generation_cancelled = False
+
+    # Poll the running generation; clicking Cancel reruns the script, which stops this loop
+    job = st.session_state.generation_job
+    if job is not None:
+        if not job.done():
+            st.button("⛔ Cancel generation", on_click=cancel_generation)
+            status = st.empty()
+            while not job.wait(0.25):
+                status.info(f"⏳ Generating MCQs... {job.deadline.elapsed():.0f}s")
+            status.empty()
+        st.session_state.generation_job = None
+
+        try:
+            show_generation_results(job.result())
+        except DeadlineExceeded as e:
+            st.error(f"⏱️ Generation stopped: {e}. Try fewer questions or a shorter document.")
+        except ExtractionMemoryError as e:
+            st.error(f"❌ Could not read the document: {e}.")
+        except Exception as e:
+            traceback.print_exception(type(e), e, e.__traceback__)
+            st.error("❌ An error occurred while generating MCQs.")
 
 # ==========================
 # TAB 2: Review & Take Quiz
@@ -115,85 +417,59 @@ with tab1:
 with tab2:
     st.header("📊 Review Analysis & Take Quiz")
 
-    # Display Quiz Review
-    if st.session_state.quiz_review:
-        st.subheader("📝 Quiz Analysis")
-
-        # Format and display review nicely
-        formatted_review = st.session_state.quiz_review.replace("\n", "\n\n")
+    record = current_quiz()
 
-        for section in formatted_review.split("\n\n"):
-            if section.strip():
-                title_line = section.split("\n")[0]  # First line as title
-                body = "\n".join(section.split("\n")[1:])  # Rest as body
-                st.markdown(f"""
-<div style="background-color:#f0f2f6;padding:15px;border-radius:10px;margin-bottom:10px;">
-    <h5 style="color:#0f62fe">{title_line.strip('**')}</h5>
-    <p>{body}</p>
-</div>
-""", unsafe_allow_html=True)
+    # Display Quiz Review (cards are pre-rendered when the quiz is generated)
+    if record is not None:
+        if len(st.session_state.quiz_set) > 1:
+            st.selectbox("Generated quiz", list(st.session_state.quiz_set), key="quiz_choice", on_change=choose_quiz)
+        st.subheader("📝 Quiz Analysis")
+        for card in record["review_cards"]:
+            st.markdown(card, unsafe_allow_html=True)
 
     else:
         st.info("ℹ️ No analysis available. Please generate a quiz in the 'MCQ Generator' tab.")
 
     # Display Quiz
-    if st.session_state.show_quiz and st.session_state.quiz_data:
+    if record is not None:
         st.markdown("---")
         st.subheader("📝 Take the Generated Quiz")
 
         # Reset button
         if st.button("🔄 Generate New Quiz"):
-            st.session_state.quiz_data = None
-            st.session_state.show_quiz = False
-            st.session_state.quiz_review = None
-            st.session_state.user_answers = {}
-            st.session_state.quiz_submitted = False
+            discard_quizzes()
             st.rerun()
 
-        # Display questions as cards
-        if 'questions' in st.session_state.quiz_data:
-            for q in st.session_state.quiz_data['questions']:
-                question_key = f"q_{q['id']}"
-                user_choice = st.radio(
-                    f"❓ Q{q['id']}: {q['question']}",
-                    [f"{key}. {value}" for key, value in q['options'].items()],
-                    key=question_key,
-                    disabled=st.session_state.quiz_submitted  # Lock after submission
-                )
-                if not st.session_state.quiz_submitted:
-                    st.session_state.user_answers[q['id']] = user_choice[0]  # Save chosen option (A/B/C/D)
+        # Only the current page of questions is rendered
+        if 'questions' in record["quiz"]:
+            questions = record["quiz"]['questions']
+            total = len(questions)
+            total_pages = max(1, -(-total // QUESTIONS_PER_PAGE))
+            st.session_state.quiz_page = min(st.session_state.quiz_page, total_pages - 1)
+            start = st.session_state.quiz_page * QUESTIONS_PER_PAGE
+            page = questions[start:start + QUESTIONS_PER_PAGE]
 
-            # Submit Quiz Button
             if not st.session_state.quiz_submitted:
-                if st.button("✅ Submit Quiz"):
-                    st.session_state.quiz_submitted = True
-                    st.rerun()
+                for q in page:
+                    render_question(q)
+                render_pagination(total_pages)
+
+                # Submit Quiz Button
+                st.button("✅ Submit Quiz", on_click=submit_quiz)
 
             # Show Results if Submitted
-            if st.session_state.quiz_submitted:
+            else:
                 st.subheader("📈 Quiz Results")
-                correct = 0
-                total = len(st.session_state.quiz_data['questions'])
-                for q in st.session_state.quiz_data['questions']:
-                    user_ans = st.session_state.user_answers.get(q['id'])  # ✅ Fixed syntax here
-                    correct_ans = q['correct_answer']
-                    explanation = q['explanation']
-
-                    if user_ans == correct_ans:
-                        correct += 1
-                        st.success(f"✅ Q{q['id']} Correct! ({correct_ans})")
-                    else:
-                        st.error(f"❌ Q{q['id']} Wrong. Correct Answer: {correct_ans}")
-
-                    st.markdown(f"**💡 Explanation:** {explanation}")
-
+                correct = sum(st.session_state.quiz_results.values())
                 st.markdown(f"### 🏆 Your Score: {correct} / {total}")
 
+                for q in page:
+                    render_question(q)
+                    render_result(q)
+                render_pagination(total_pages)
+
                 # Restart Quiz button
-                if st.button("🔁 Restart Quiz"):
-                    st.session_state.user_answers = {}
-                    st.session_state.quiz_submitted = False
-                    st.rerun()
+                st.button("🔁 Restart Quiz", on_click=clear_answers)
 
         else:
             st.warning("⚠️ No questions found in the quiz data.")